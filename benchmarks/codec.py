@@ -0,0 +1,60 @@
+import argparse
+import gzip
+import statistics
+import time
+from collections import defaultdict
+
+from benchmarks.generate import generate_task
+from ya_courier_helpers.codec import CODECS, orjson
+from ya_courier_helpers.mvrp_solution_uploader import load_task
+from ya_courier_helpers.payload import build_orders
+
+GZIP_LEVELS = (1, 6, 9)
+
+
+def measure(func, runs):
+    """
+    Returns (result of func(), median time of `runs` calls in ms).
+    """
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return result, statistics.median(times) * 1000
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Measures JSON codecs and gzip levels on an orders-batch request body of a synthetic MVRP task')
+
+    parser.add_argument('--orders', type=int, default=500, help='Number of orders in the batch')
+    parser.add_argument('--runs', type=int, default=50, help='Number of runs')
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    request, response = generate_task(max(1, args.orders // 100), args.orders)
+    task = load_task(request, response['result'], 'depot')
+    orders = list(build_orders(task.locations, task.index, defaultdict(dict), '+70000000000'))
+
+    print('{:<30} {:>10} {:>10}'.format('{} orders'.format(len(orders)), 'median, ms', 'size, KB'))
+    codecs = [codec for name, codec in sorted(CODECS.items()) if name != 'orjson' or orjson is not None]
+    for codec in codecs:
+        body, dumps_ms = measure(lambda: codec.dumps(orders), args.runs)
+        print('{:<30} {:>10.2f} {:>10.1f}'.format('{} dumps'.format(codec.name), dumps_ms, len(body) / 1024.0))
+        _, loads_ms = measure(lambda: codec.loads(body), args.runs)
+        print('{:<30} {:>10.2f}'.format('{} loads'.format(codec.name), loads_ms))
+
+    for level in GZIP_LEVELS:
+        compressed, compress_ms = measure(lambda: gzip.compress(body, compresslevel=level), args.runs)
+        print('{:<30} {:>10.2f} {:>10.1f}'.format('gzip level {}'.format(level), compress_ms,
+                                                  len(compressed) / 1024.0))
+    _, decompress_ms = measure(lambda: gzip.decompress(compressed), args.runs)
+    print('{:<30} {:>10.2f}'.format('gunzip', decompress_ms))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+import argparse
+import json
+import random
+
+DATE = '2020-01-01'
+DEPOT_POINT = {'lat': 55.733996, 'lon': 37.588472}
+TIME_WINDOWS = ['{:02d}:00-{:02d}:00'.format(h, h + 2) for h in range(8, 20)]
+
+
+def generate_task(vehicles, locations, dropped=0, date=DATE, seed=0, ref_prefix=''):
+    """
+    Returns (request, response) MVRP logs with `locations` orders spread over `vehicles` routes,
+    `dropped` of them are left out of the routes. Refs start with ref_prefix, so that several tasks
+    can be uploaded for the same date.
+    """
+    rnd = random.Random(seed)
+
+    depot = {
+        'id': 0,
+        'ref': '{}depot-0'.format(ref_prefix),
+        'point': DEPOT_POINT,
+        'time_window': '07:00-23:00',
+        'service_duration_s': 600,
+    }
+    request_vehicles = [{'id': i, 'ref': '{}vehicle-{}'.format(ref_prefix, i)} for i in range(vehicles)]
+    request_locations = [
+        {
+            'id': i,
+            'ref': '{}order-{}'.format(ref_prefix, i),
+            'point': {
+                'lat': DEPOT_POINT['lat'] + rnd.uniform(-0.3, 0.3),
+                'lon': DEPOT_POINT['lon'] + rnd.uniform(-0.5, 0.5),
+            },
+            'time_window': rnd.choice(TIME_WINDOWS),
+            'service_duration_s': rnd.choice((300, 600, 900)),
+            'shared_service_duration_s': rnd.choice((0, 120)),
+            'description': 'Address {}'.format(i),
+            'title': 'Customer {}'.format(i),
+            # Fields the uploader does not use, real logs have plenty of them
+            'shipment_size': {'weight_kg': rnd.uniform(0.5, 20), 'volume': {'width_m': 0.3, 'height_m': 0.3}},
+            'required_tags': ['tag-{}'.format(rnd.randrange(5))],
+            'hard_window': False,
+        }
+        for i in range(1, locations + 1)
+    ]
+
+    request = {
+        'depot': depot,
+        'vehicles': request_vehicles,
+        'locations': request_locations,
+        'options': {'date': date, 'time_zone': 3, 'quality': 'normal'},
+    }
+
+    routes = [
+        {
+            'vehicle_id': v['id'],
+            'shift': {'id': '0'},
+            'route': [{'node': {'type': 'depot', 'value': dict(depot)}, 'multi_order': False}],
+            'metrics': {'total_duration_s': 0},
+        }
+        for v in request_vehicles
+    ]
+    dropped_locations = []
+    for i, l in enumerate(request_locations):
+        if i < dropped:
+            dropped_locations.append({'id': l['id'], 'ref': l['ref'], 'drop_reason': 'time window'})
+            continue
+        routes[rnd.randrange(vehicles)]['route'].append({
+            'node': {'type': 'location', 'value': dict(l)},
+            'multi_order': False,
+            'arrival_time_s': rnd.randrange(8 * 3600, 20 * 3600),
+        })
+
+    response = {
+        'id': 'benchmark',
+        'status': {'queued': 0, 'completed': 1},
+        'result': {
+            'routes': routes,
+            'vehicles': request_vehicles,
+            'dropped_locations': dropped_locations,
+            'options': request['options'],
+        },
+    }
+    return request, response
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Generates synthetic MVRP request and response logs')
+
+    parser.add_argument('--vehicles', type=int, default=100, help='Number of vehicles and routes')
+    parser.add_argument('--locations', type=int, default=10000, help='Number of locations')
+    parser.add_argument('--dropped', type=int, default=0, help='Number of dropped locations')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--request-out', required=True, help='File to write the request log to')
+    parser.add_argument('--response-out', required=True, help='File to write the response log to')
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    request, response = generate_task(args.vehicles, args.locations, args.dropped, seed=args.seed)
+    with open(args.request_out, 'w') as f:
+        json.dump(request, f)
+    with open(args.response_out, 'w') as f:
+        json.dump(response, f)
+
+
+if __name__ == '__main__':
+    main()
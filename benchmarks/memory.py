@@ -0,0 +1,75 @@
+import argparse
+import gc
+import json
+import tracemalloc
+from collections import defaultdict
+
+from benchmarks.generate import generate_task
+from ya_courier_helpers.batcher import AdaptiveBatcher
+from ya_courier_helpers.mvrp_log import REQUEST_FIELDS, RESPONSE_FIELDS, prune
+from ya_courier_helpers.mvrp_solution_uploader import load_task
+from ya_courier_helpers.payload import build_orders
+
+
+def traced_mb():
+    gc.collect()
+    return tracemalloc.get_traced_memory()[0] / 1024.0 / 1024
+
+
+def measure(build):
+    """
+    Returns (result of build(), MB allocated by it and still held by the result).
+    """
+    start = traced_mb()
+    result = build()
+    return result, traced_mb() - start
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Measures memory held by a synthetic MVRP task as parsed logs and as the records uploaded from')
+
+    parser.add_argument('--vehicles', type=int, default=1000, help='Number of vehicles')
+    parser.add_argument('--locations', type=int, default=200000, help='Number of locations')
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    request, response = generate_task(args.vehicles, args.locations)
+    request, response = json.dumps(request).encode('utf-8'), json.dumps(response).encode('utf-8')
+
+    tracemalloc.start()
+    results = []
+
+    logs, size = measure(lambda: (json.loads(request), json.loads(response)))
+    results.append(('parsed logs', size))
+    del logs
+
+    start = traced_mb()
+    logs = prune(json.loads(request), REQUEST_FIELDS), prune(json.loads(response), RESPONSE_FIELDS)
+    results.append(('parsed logs, --stream-logs fields', traced_mb() - start))
+
+    # Strings are shared by the logs and the records, so the records are measured once the logs are freed
+    task = load_task(logs[0], logs[1]['result'], 'depot')
+    del logs
+    results.append(('Task records', traced_mb() - start))
+
+    orders, size = measure(lambda: list(build_orders(task.locations, task.index, defaultdict(dict), '+70000000000')))
+    results.append(('order dicts of all locations', size))
+    del orders
+
+    batch, size = measure(lambda: next(AdaptiveBatcher().batches(
+        build_orders(task.locations, task.index, defaultdict(dict), '+70000000000'))))
+    results.append(('order dicts of one batch ({} orders)'.format(len(batch)), size))
+
+    tracemalloc.stop()
+
+    print('{:<45} {:>10}'.format('data', 'MB'))
+    for name, size in results:
+        print('{:<45} {:>10.1f}'.format(name, size))
+
+
+if __name__ == '__main__':
+    main()
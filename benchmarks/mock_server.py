@@ -0,0 +1,286 @@
+import argparse
+import gzip
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+PAGE_SIZE = 1000
+
+# (method, path regex, handler name, endpoint name used in stats)
+ROUTES = [
+    ('POST', r'/api/v1/companies/\d+/(orders|routes|couriers|depots)-batch$', 'batch', '{0}-batch'),
+    ('GET', r'/api/v1/companies/\d+/orders$', 'list_orders', 'orders'),
+    ('GET', r'/api/v1/companies/\d+/routes$', 'list_routes', 'routes'),
+    ('POST', r'/api/v1/companies/\d+/routes/(\d+)/fix-orders$', 'fix_orders', 'routes/{{id}}/fix-orders'),
+    ('DELETE', r'/api/v1/companies/\d+/routes/(\d+)/fix-orders$', 'unfix_orders', 'routes/{{id}}/fix-orders'),
+    ('DELETE', r'/api/v1/companies/\d+/orders/(\d+)$', 'delete_order', 'orders/{{id}}'),
+    ('DELETE', r'/api/v1/companies/\d+/routes/(\d+)$', 'delete_route', 'routes/{{id}}'),
+    ('GET', r'/vrs/api/v1/log/(request|response)/([\w-]+)$', 'mvrp_log', 'log/{0}'),
+]
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super(HttpError, self).__init__(message)
+        self.status = status
+
+
+class State(object):
+    """
+    In-memory Ya.Courier company data.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.next_id = 1
+        self.objects = {'orders': {}, 'routes': {}, 'couriers': {}, 'depots': {}}
+        self.numbers = {kind: {} for kind in self.objects}
+        self.fixed_orders = {}
+        self.mvrp_logs = {}
+
+    def batch(self, kind, data):
+        inserted = updated = 0
+        with self.lock:
+            objects = self.objects[kind]
+            for item in data:
+                if kind == 'orders' and 'route_number' in item:
+                    route = self.objects['routes'].get(item['route_number'])
+                    if route is None:
+                        raise HttpError(422, 'Route {} does not exist'.format(item['route_number']))
+                    item['route_id'] = route['id']
+                    item['date'] = route['date']
+
+                if item['number'] in objects:
+                    objects[item['number']].update(item)
+                    updated += 1
+                else:
+                    item['id'] = self.next_id
+                    self.next_id += 1
+                    objects[item['number']] = item
+                    self.numbers[kind][item['id']] = item['number']
+                    inserted += 1
+        return {'inserted': inserted, 'updated': updated}
+
+    def delete(self, kind, object_id):
+        with self.lock:
+            number = self.numbers[kind].pop(object_id, None)
+            if number is None:
+                raise HttpError(404, '{} {} not found'.format(kind, object_id))
+            del self.objects[kind][number]
+            return {}
+
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address, latency_ms=0, jitter_ms=0, max_in_flight=0, page_size=PAGE_SIZE, mb_latency_ms=0,
+                 max_body_kb=0):
+        ThreadingHTTPServer.__init__(self, address, Handler)
+        self.state = State()
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.max_in_flight = max_in_flight
+        self.page_size = page_size
+        self.mb_latency_ms = mb_latency_ms
+        self.max_body_kb = max_body_kb
+
+        self.stats_lock = threading.Lock()
+        self.in_flight = 0
+        self.requests = Counter()
+        self.throttled = Counter()
+        self.bytes_received = 0
+        self.bytes_sent = 0
+
+    @property
+    def url(self):
+        return 'http://{}:{}'.format(*self.server_address)
+
+    def reset_stats(self):
+        with self.stats_lock:
+            self.requests.clear()
+            self.throttled.clear()
+            self.bytes_received = 0
+            self.bytes_sent = 0
+
+    def stats(self):
+        with self.stats_lock:
+            return {
+                'requests': sum(self.requests.values()),
+                'throttled': sum(self.throttled.values()),
+                'bytes_received': self.bytes_received,
+                'bytes_sent': self.bytes_sent,
+                'endpoints': dict(self.requests),
+            }
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately, with Nagle's algorithm every response would wait for delayed ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def do_DELETE(self):
+        self.dispatch('DELETE')
+
+    def dispatch(self, method):
+        server = self.server
+        url = urlsplit(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        for handler_method, pattern, handler, endpoint in ROUTES:
+            match = re.match(pattern, url.path)
+            if handler_method == method and match:
+                endpoint = '{} {}'.format(method, endpoint.format(*match.groups()))
+                break
+        else:
+            return self.reply(404, {'message': 'Unknown endpoint {} {}'.format(method, url.path)})
+
+        with server.stats_lock:
+            server.requests[endpoint] += 1
+            server.bytes_received += len(body)
+            throttled = server.max_in_flight and server.in_flight >= server.max_in_flight
+            if throttled:
+                server.throttled[endpoint] += 1
+            else:
+                server.in_flight += 1
+
+        if throttled:
+            return self.reply(429, {'message': 'Too many requests'}, {'Retry-After': '1'})
+
+        try:
+            if self.headers.get('Content-Encoding') == 'gzip':
+                body = gzip.decompress(body)
+            if server.max_body_kb and len(body) > server.max_body_kb * 1024:
+                raise HttpError(413, 'Request body is larger than {} KB'.format(server.max_body_kb))
+            latency_ms = server.latency_ms + random.uniform(0, server.jitter_ms) + \
+                server.mb_latency_ms * len(body) / 1024.0 / 1024
+            if latency_ms:
+                time.sleep(latency_ms / 1000.0)
+            data = json.loads(body) if body else None
+            status, result = 200, getattr(self, handler)(match, query, data)
+        except HttpError as e:
+            status, result = e.status, {'message': str(e)}
+        except Exception as e:
+            status, result = 500, {'message': repr(e)}
+        finally:
+            # Released before replying: the client may send its next request as soon as it gets the response
+            with server.stats_lock:
+                server.in_flight -= 1
+        self.reply(status, result)
+
+    def reply(self, status, data, headers=None):
+        body = data if isinstance(data, bytes) else json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        with self.server.stats_lock:
+            self.server.bytes_sent += len(body)
+
+    def page(self, items, query):
+        if 'page' not in query:
+            return items
+        page = int(query['page'])
+        size = self.server.page_size
+        return items[(page - 1) * size:page * size]
+
+    def batch(self, match, query, data):
+        return self.server.state.batch(match.group(1), data)
+
+    def list_orders(self, match, query, data):
+        state = self.server.state
+        with state.lock:
+            orders = [dict(o) for o in state.objects['orders'].values()]
+        if 'route_id' in query:
+            orders = [o for o in orders if o.get('route_id') == int(query['route_id'])]
+        if 'date' in query:
+            orders = [o for o in orders if o.get('date') == query['date']]
+        return self.page(orders, query)
+
+    def list_routes(self, match, query, data):
+        state = self.server.state
+        with state.lock:
+            return [dict(r) for r in state.objects['routes'].values() if r['date'] == query.get('date')]
+
+    def fix_orders(self, match, query, data):
+        self.server.state.fixed_orders[int(match.group(1))] = data['orders']
+        return {}
+
+    def unfix_orders(self, match, query, data):
+        self.server.state.fixed_orders.pop(int(match.group(1)), None)
+        return {}
+
+    def delete_order(self, match, query, data):
+        return self.server.state.delete('orders', int(match.group(1)))
+
+    def delete_route(self, match, query, data):
+        return self.server.state.delete('routes', int(match.group(1)))
+
+    def mvrp_log(self, match, query, data):
+        key = (match.group(1), match.group(2))
+        if key not in self.server.state.mvrp_logs:
+            raise HttpError(404, 'Task {} not found'.format(match.group(2)))
+        return self.server.state.mvrp_logs[key]
+
+
+def start_server(port=0, **kwargs):
+    """
+    Starts the server in a background thread, port 0 picks a free one.
+    """
+    server = Server(('127.0.0.1', port), **kwargs)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Local stand-in for Ya.Courier and MVRP log APIs')
+
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency-ms', type=float, default=0, help='Delay added to every request')
+    parser.add_argument('--jitter-ms', type=float, default=0, help='Random delay up to this added to every request')
+    parser.add_argument('--max-in-flight', type=int, default=0,
+                        help='Requests over this number in flight get 429, 0 disables throttling')
+    parser.add_argument('--page-size', type=int, default=PAGE_SIZE, help='Orders listing page size')
+    parser.add_argument('--mb-latency-ms', type=float, default=0, help='Delay added per MB of request body')
+    parser.add_argument('--max-body-kb', type=int, default=0,
+                        help='Requests with larger bodies get 413, 0 disables the limit')
+    parser.add_argument('--task', nargs=3, action='append', default=[], metavar=('TASK_ID', 'REQUEST', 'RESPONSE'),
+                        help='Serve MVRP request and response log files for the task id')
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    server = Server(('127.0.0.1', args.port), latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                    max_in_flight=args.max_in_flight, page_size=args.page_size, mb_latency_ms=args.mb_latency_ms,
+                    max_body_kb=args.max_body_kb)
+    for task_id, request_path, response_path in args.task:
+        for kind, path in (('request', request_path), ('response', response_path)):
+            with open(path, 'rb') as f:
+                server.state.mvrp_logs[(kind, task_id)] = f.read()
+    print('Serving on {}'.format(server.url))
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+import argparse
+import json
+import statistics
+import time
+
+from benchmarks.generate import generate_task
+from ya_courier_helpers.mvrp_check import normalize_task
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Measures time of normalizing and checking refs of a synthetic MVRP task')
+
+    parser.add_argument('--vehicles', type=int, default=1000, help='Number of vehicles')
+    parser.add_argument('--locations', type=int, default=200000, help='Number of locations')
+    parser.add_argument('--runs', type=int, default=5, help='Number of runs')
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    request, response = generate_task(args.vehicles, args.locations)
+    # Every other ref is longer than MAX_REF_LEN and is truncated
+    for loc in request['locations'] + [n['node']['value'] for r in response['result']['routes'] for n in r['route']]:
+        if loc['id'] % 2:
+            loc['ref'] = loc['ref'].ljust(100, '-')
+    logs = json.dumps(request), json.dumps(response)
+
+    times = []
+    for _ in range(args.runs):
+        request, response = json.loads(logs[0]), json.loads(logs[1])
+        start = time.perf_counter()
+        normalize_task(request, response['result'])
+        times.append(time.perf_counter() - start)
+
+    print('{:<42} {:>10} {:>10}'.format('locations', 'min, ms', 'median, ms'))
+    print('{:<42} {:>10.1f} {:>10.1f}'.format(args.locations, min(times) * 1000, statistics.median(times) * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+import argparse
+import json
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.generate import DATE, generate_task
+from benchmarks.mock_server import PAGE_SIZE, start_server
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TASK_ID = 'benchmark'
+COMPANY_ID = '1'
+TOKEN = 'benchmark'
+
+TOOLS = ['upload', 'fix-time-intervals', 'service-duration', 'clear']
+
+
+def run_process(argv, env, stdin=None, log_path=os.devnull):
+    """
+    Runs argv and returns (exit code, wall-clock seconds, peak RSS in MB).
+    """
+    with open(log_path, 'wb') as log:
+        start = time.time()
+        p = subprocess.Popen(argv, env=env, stdin=subprocess.PIPE if stdin is not None else subprocess.DEVNULL,
+                             stdout=log, stderr=subprocess.STDOUT)
+        if stdin is not None:
+            p.stdin.write(stdin)
+            p.stdin.close()
+        # wait4 gives resource usage of this child only
+        _, status, rusage = os.wait4(p.pid, 0)
+        wall = time.time() - start
+        p.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+    return p.returncode, wall, rusage.ru_maxrss / 1024.0
+
+
+def get_env(server, work_dir):
+    env = dict(os.environ)
+    env.update({
+        'PYTHONPATH': os.pathsep.join(filter(None, [REPO_DIR, env.get('PYTHONPATH')])),
+        'YA_COURIER_API_URL': server.url + '/api/v1',
+        'YA_COURIER_MVRP_API_URL': server.url + '/vrs/api/v1',
+        'YA_COURIER_TOKEN': TOKEN,
+        'YA_COURIER_COMPANY_ID': COMPANY_ID,
+        'YA_COURIER_JOURNAL_DIR': os.path.join(work_dir, 'journal'),
+    })
+    return env
+
+
+def get_task_ids(tasks):
+    if tasks == 1:
+        return [TASK_ID]
+    return ['{}-{}'.format(TASK_ID, i) for i in range(tasks)]
+
+
+def get_ref_prefix(task_id):
+    return '' if task_id == TASK_ID else task_id + '-'
+
+
+def get_command(tool, args, locations):
+    """
+    Returns (argv, stdin) to run the tool.
+    """
+    task_ids = get_task_ids(args.tasks)
+    if tool == 'upload':
+        return ['-m', 'ya_courier_helpers.mvrp_solution_uploader', '--task-id'] + task_ids + \
+            shlex.split(args.upload_args), None
+    if tool == 'clear':
+        return ['-m', 'ya_courier_helpers.mvrp_solution_uploader', '--task-id', TASK_ID, '--clear', '--date', DATE] + \
+            shlex.split(args.clear_args), None
+    if tool == 'fix-time-intervals':
+        return ['-m', 'ya_courier_helpers.multiorder_time_interval_fixer', '--company-id', COMPANY_ID,
+                '--token', TOKEN, '--date', DATE] + shlex.split(args.fixer_args), None
+    if tool == 'service-duration':
+        stdin = ''.join(
+            '{}order-{}\t{}\n'.format(get_ref_prefix(task_id), i, 600)
+            for task_id in task_ids for i in range(1, locations + 1)
+        ).encode('utf-8')
+        return ['-m', 'ya_courier_helpers.order_service_duration_uploader', '--company-id', COMPANY_ID,
+                '--token', TOKEN] + shlex.split(args.service_duration_args), stdin
+    raise ValueError('Unknown tool {}'.format(tool))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Runs ya-courier-helpers tools against the local mock server')
+
+    parser.add_argument('--tasks', type=int, default=1, help='Number of synthetic tasks uploaded together')
+    parser.add_argument('--vehicles', type=int, default=100, help='Number of vehicles in every synthetic task')
+    parser.add_argument('--locations', type=int, default=10000, help='Number of locations in every synthetic task')
+    parser.add_argument('--dropped', type=int, default=0, help='Number of dropped locations')
+    parser.add_argument('--latency-ms', type=float, default=20, help='Mock server latency')
+    parser.add_argument('--jitter-ms', type=float, default=0, help='Mock server latency jitter')
+    parser.add_argument('--max-in-flight', type=int, default=0,
+                        help='Mock server answers 429 over this number of requests in flight, 0 disables it')
+    parser.add_argument('--page-size', type=int, default=PAGE_SIZE, help='Mock server orders listing page size')
+    parser.add_argument('--mb-latency-ms', type=float, default=0, help='Mock server latency per MB of request body')
+    parser.add_argument('--max-body-kb', type=int, default=0,
+                        help='Mock server answers 413 to larger request bodies, 0 disables the limit')
+    parser.add_argument('--tools', default=','.join(TOOLS),
+                        help='Comma separated tools to run in order: {}'.format(', '.join(TOOLS)))
+    parser.add_argument('--upload-args', default='', help='Extra arguments for ya-courier-solution-uploader')
+    parser.add_argument('--clear-args', default='', help='Extra arguments for ya-courier-solution-uploader --clear')
+    parser.add_argument('--fixer-args', default='', help='Extra arguments for ya-courier-multiorder-timeinterval-fixer')
+    parser.add_argument('--service-duration-args', default='',
+                        help='Extra arguments for ya-courier-service-duration-uploader')
+    parser.add_argument('--json-out', help='Write results to this file as JSON')
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    server = start_server(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, max_in_flight=args.max_in_flight,
+                          page_size=args.page_size, mb_latency_ms=args.mb_latency_ms, max_body_kb=args.max_body_kb)
+    for seed, task_id in enumerate(get_task_ids(args.tasks)):
+        request, response = generate_task(args.vehicles, args.locations, args.dropped, seed=seed,
+                                          ref_prefix=get_ref_prefix(task_id))
+        server.state.mvrp_logs[('request', task_id)] = json.dumps(request).encode('utf-8')
+        server.state.mvrp_logs[('response', task_id)] = json.dumps(response).encode('utf-8')
+        del request, response
+
+    work_dir = tempfile.mkdtemp(prefix='ya-courier-benchmark-')
+    env = get_env(server, work_dir)
+
+    results = []
+    print('{:<20} {:>6} {:>10} {:>10} {:>10} {:>10} {:>12}'.format(
+        'tool', 'exit', 'wall, s', 'requests', 'throttled', 'sent, MB', 'peak RSS, MB'))
+    for tool in args.tools.split(','):
+        argv, stdin = get_command(tool, args, args.locations)
+        log_path = os.path.join(work_dir, '{}.log'.format(tool))
+
+        server.reset_stats()
+        exit_code, wall, peak_rss = run_process([sys.executable] + argv, env, stdin, log_path)
+        stats = server.stats()
+
+        results.append(dict(tool=tool, exit_code=exit_code, wall_s=wall, peak_rss_mb=peak_rss, log=log_path, **stats))
+        print('{:<20} {:>6} {:>10.2f} {:>10} {:>10} {:>10.2f} {:>12.1f}'.format(
+            tool, exit_code, wall, stats['requests'], stats['throttled'], stats['bytes_received'] / 1024.0 / 1024,
+            peak_rss))
+        if exit_code:
+            print('{} failed, see {}'.format(tool, log_path))
+
+    if args.json_out:
+        with open(args.json_out, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
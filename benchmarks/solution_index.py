@@ -0,0 +1,89 @@
+import argparse
+import statistics
+import time
+from collections import defaultdict
+
+from benchmarks.generate import generate_task
+from ya_courier_helpers.model import Location
+from ya_courier_helpers.payload import build_orders
+from ya_courier_helpers.solution_index import SolutionIndex
+
+# Locations uploaded in one request before SolutionIndex
+CHUNK_SIZE = 500
+
+
+def build_chunk_lookups(solution):
+    """
+    Lookups rebuilt by every orders upload request before SolutionIndex: one pass over all routes of the solution.
+    """
+    loc2veh = {}
+    loc2shift = {}
+    loc2multi = {}
+    for route in solution['routes']:
+        for loc in route['route']:
+            if loc['node']['type'] == 'location':
+                loc2veh[loc['node']['value']['id']] = route['vehicle_id']
+                loc2shift[loc['node']['value']['id']] = route['shift']['id']
+                loc2multi[loc['node']['value']['id']] = loc['multi_order']
+    veh_dict = {v['id']: v for v in solution['vehicles']}
+    dropped_locations = {l['id']: l for l in solution['dropped_locations']}
+    return loc2veh, loc2shift, loc2multi, veh_dict, dropped_locations
+
+
+def build_orders_per_chunk(request, solution):
+    orders = []
+    for start in range(0, len(request['locations']), CHUNK_SIZE):
+        loc2veh, loc2shift, loc2multi, veh_dict, _ = build_chunk_lookups(solution)
+        for l in request['locations'][start:start + CHUNK_SIZE]:
+            if l['id'] in loc2veh:
+                orders.append({
+                    'number': l['ref'],
+                    'lat': l['point']['lat'],
+                    'lon': l['point']['lon'],
+                    'address': l.get('description', '-'),
+                    'service_duration_s': 0 if loc2multi[l['id']]
+                    else l.get('service_duration_s', 0) + l.get('shared_service_duration_s', 0),
+                    'customer_name': l.get('title', '-'),
+                    'time_interval': l['time_window'],
+                    'route_number': '{}-{}-{}'.format(veh_dict[loc2veh[l['id']]]['ref'], loc2shift[l['id']],
+                                                      solution['options']['date'])
+                })
+    return orders
+
+
+def build_orders_with_index(request, solution):
+    index = SolutionIndex(solution)
+    locations = [Location.from_dict(l) for l in request['locations']]
+    return list(build_orders(locations, index, defaultdict(dict), '+70000000000'))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Measures time of building orders of a synthetic MVRP task with lookups rebuilt for every '
+                    '{} locations and with SolutionIndex built once'.format(CHUNK_SIZE))
+
+    parser.add_argument('--vehicles', type=int, default=1000, help='Number of vehicles')
+    parser.add_argument('--locations', type=int, default=100000, help='Number of locations')
+    parser.add_argument('--runs', type=int, default=3, help='Number of runs')
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    request, response = generate_task(args.vehicles, args.locations)
+    solution = response['result']
+
+    print('{:<42} {:>10} {:>10}'.format('lookups', 'min, s', 'median, s'))
+    for name, build in (('rebuilt for every {} locations'.format(CHUNK_SIZE), build_orders_per_chunk),
+                        ('SolutionIndex', build_orders_with_index)):
+        times = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            build(request, solution)
+            times.append(time.perf_counter() - start)
+        print('{:<42} {:>10.2f} {:>10.2f}'.format(name, min(times), statistics.median(times)))
+
+
+if __name__ == '__main__':
+    main()
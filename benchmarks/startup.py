@@ -0,0 +1,59 @@
+import argparse
+import compileall
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.run import REPO_DIR
+
+ENTRY_POINTS = [
+    ('ya-courier-service-duration-uploader', 'ya_courier_helpers.order_service_duration_uploader'),
+    ('ya-courier-multiorder-timeinterval-fixer', 'ya_courier_helpers.multiorder_time_interval_fixer'),
+    ('ya-courier-solution-uploader', 'ya_courier_helpers.mvrp_solution_uploader'),
+]
+
+
+def get_env():
+    """
+    Environment without Ya.Courier credentials: -h should work without them.
+    """
+    env = {k: v for k, v in os.environ.items() if not k.startswith('YA_COURIER_')}
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [REPO_DIR, env.get('PYTHONPATH')]))
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    return env
+
+
+def time_command(argv, env, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(argv, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Measures start up time of ya-courier-helpers tools running -h')
+
+    parser.add_argument('--runs', type=int, default=20, help='Number of runs of every tool')
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    env = get_env()
+    # Installed packages are byte-compiled, so measure the same
+    compileall.compile_dir(os.path.join(REPO_DIR, 'ya_courier_helpers'), quiet=1)
+
+    print('{:<42} {:>10} {:>10}'.format('tool', 'min, ms', 'median, ms'))
+    for name, argv in [('python -c pass', ['-c', 'pass'])] + [(name, ['-m', module, '-h'])
+                                                               for name, module in ENTRY_POINTS]:
+        times = time_command([sys.executable] + argv, env, args.runs)
+        print('{:<42} {:>10.1f} {:>10.1f}'.format(name, min(times) * 1000, statistics.median(times) * 1000))
+
+
+if __name__ == '__main__':
+    main()
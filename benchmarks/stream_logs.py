@@ -0,0 +1,69 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+from benchmarks.run import REPO_DIR, run_process
+from ya_courier_helpers.mvrp_log import REQUEST_FIELDS, RESPONSE_FIELDS, load_pruned
+
+# Ways of parsing MVRP logs, 'imports' only loads the modules to show the RSS of the process without logs
+MODES = ['imports', 'json.load', 'stream']
+
+
+def parse_logs(mode, request_path, response_path):
+    """
+    Parses the logs the way the uploader does without and with --stream-logs and keeps them until exit.
+    """
+    logs = []
+    for path, fields in ((request_path, REQUEST_FIELDS), (response_path, RESPONSE_FIELDS)):
+        if mode == 'imports':
+            continue
+        with open(path, 'rb') as f:
+            logs.append(json.load(f) if mode == 'json.load' else load_pruned(f, fields))
+    return logs
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Measures peak RSS of parsing synthetic MVRP logs with json.load and with --stream-logs')
+
+    parser.add_argument('--vehicles', type=int, default=1000, help='Number of vehicles')
+    parser.add_argument('--locations', type=int, default=200000, help='Number of locations')
+    parser.add_argument('--parse', nargs=3, metavar=('MODE', 'REQUEST', 'RESPONSE'),
+                        help='Parse the logs in this process, used by the benchmark for every mode')
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.parse:
+        parse_logs(*args.parse)
+        return
+
+    work_dir = tempfile.mkdtemp(prefix='ya-courier-benchmark-')
+    try:
+        paths = [os.path.join(work_dir, 'request.json'), os.path.join(work_dir, 'response.json')]
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO_DIR, os.environ.get('PYTHONPATH')])))
+        # Peak RSS of a child counts the memory it was forked with, so this process never holds the task
+        exit_code, _, _ = run_process([sys.executable, '-m', 'benchmarks.generate', '--vehicles', str(args.vehicles),
+                                       '--locations', str(args.locations), '--request-out', paths[0],
+                                       '--response-out', paths[1]], env)
+        if exit_code:
+            raise RuntimeError('Generating logs failed')
+        print('logs: {:.1f} MB'.format(sum(os.path.getsize(path) for path in paths) / 1024.0 / 1024))
+        print('{:<20} {:>10} {:>12}'.format('mode', 'wall, s', 'peak RSS, MB'))
+        for mode in MODES:
+            exit_code, wall, peak_rss = run_process(
+                [sys.executable, '-m', 'benchmarks.stream_logs', '--parse', mode] + paths, env)
+            if exit_code:
+                raise RuntimeError('Parsing logs with {} failed'.format(mode))
+            print('{:<20} {:>10.2f} {:>12.1f}'.format(mode, wall, peak_rss))
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+import argparse
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from ya_courier_helpers.util import parse_interval_sec, parse_time_sec
+
+
+def parse_time_strptime(str_time):
+    """
+    parse_time before parse_time_sec, without the days offset.
+    """
+    sep_count = str_time.count(':')
+    if sep_count == 2:
+        t = datetime.strptime(str_time, '%H:%M:%S')
+    elif sep_count == 1:
+        t = datetime.strptime(str_time, '%H:%M')
+    else:
+        t = datetime.strptime(str_time, '%H')
+    return timedelta(hours=t.hour, minutes=t.minute, seconds=t.second).seconds
+
+
+def parse_interval_strptime(time_interval):
+    t = [v.strip() for v in time_interval.split('-')]
+    return parse_time_strptime(t[0]), parse_time_strptime(t[1])
+
+
+def parse_interval_uncached(time_interval):
+    t = time_interval.split('-')
+    return parse_time_sec.__wrapped__(t[0].strip()), parse_time_sec.__wrapped__(t[1].strip())
+
+
+def get_intervals(count, distinct, rnd):
+    """
+    Returns `count` time intervals taking `distinct` different values, as orders of a day do.
+    """
+    values = []
+    for _ in range(distinct):
+        start = rnd.randrange(6 * 60, 20 * 60)
+        end = start + rnd.choice((30, 60, 120, 240))
+        values.append('{:02d}:{:02d} - {:02d}:{:02d}'.format(start // 60, start % 60, end // 60, end % 60))
+    return [rnd.choice(values) for _ in range(count)]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Measures parsing of time intervals with strptime, '
+                                                 'parse_time_sec and its cache')
+
+    parser.add_argument('--intervals', type=int, default=100000, help='Number of intervals parsed')
+    parser.add_argument('--distinct', type=int, default=50, help='Number of different intervals among them')
+    parser.add_argument('--runs', type=int, default=5, help='Number of runs')
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    intervals = get_intervals(args.intervals, args.distinct, random.Random(0))
+
+    print('{:<42} {:>10} {:>10}'.format('{} intervals'.format(len(intervals)), 'min, ms', 'median, ms'))
+    for name, parse in (('strptime', parse_interval_strptime),
+                        ('parse_time_sec', parse_interval_uncached),
+                        ('parse_interval_sec, cached', parse_interval_sec)):
+        times = []
+        for _ in range(args.runs):
+            parse_interval_sec.cache_clear()
+            parse_time_sec.cache_clear()
+            start = time.perf_counter()
+            for interval in intervals:
+                parse(interval)
+            times.append(time.perf_counter() - start)
+        print('{:<42} {:>10.1f} {:>10.1f}'.format(name, min(times) * 1000, statistics.median(times) * 1000))
+
+
+if __name__ == '__main__':
+    main()
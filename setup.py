@@ -3,16 +3,21 @@ from setuptools import find_packages, setup
 setup(
     name='ya-courier-helpers',
     version='1.0.8',
-    packages=find_packages(),
+    packages=find_packages(exclude=['benchmarks', 'benchmarks.*']),
     url='https://github.com/roschupkin/ya.courier.helpers',
     license='Apache License 2.0',
     author='Yandex B2BGeo Team',
     author_email='b2bgeo@yandex-team.ru',
     description='Ya.Courier helper scripts',
     install_requires=[
-        'requests', 'retrying'
+        'requests'
     ],
-    python_requires='>=3.6',
+    extras_require={
+        'streaming': ['ijson>=3.1'],
+        'async': ['aiohttp'],
+        'fast-json': ['orjson'],
+    },
+    python_requires='>=3.7',
     entry_points={
         'console_scripts': [
             'ya-courier-service-duration-uploader=ya_courier_helpers.order_service_duration_uploader:main',
@@ -0,0 +1,282 @@
+import asyncio
+import logging
+import time
+from functools import partial
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from ya_courier_helpers.batcher import REQUEST_ENTITY_TOO_LARGE
+from ya_courier_helpers.client import get_auth_header
+from ya_courier_helpers.codec import encode_body, get_codec
+from ya_courier_helpers.config import API_URL, TIMEOUT, get_company_id, get_token
+from ya_courier_helpers.metrics import METRICS
+from ya_courier_helpers.payload import encode_orders
+from ya_courier_helpers.retry_policy import RETRIABLE_STATUS_CODES, RetryPolicy, parse_retry_after
+from ya_courier_helpers.mvrp_solution_uploader import CLEAR_PROGRESS_STEP, check_date_cleared, check_orders_uploaded, \
+    get_old_orders, get_orders_by_date, get_routes
+
+CONCURRENCY = 1000
+
+
+def classify_error(e):
+    """
+    aiohttp counterpart of client.classify_error.
+    """
+    if isinstance(e, (aiohttp.ClientConnectionError, asyncio.TimeoutError)):
+        return True, None, None
+    if isinstance(e, aiohttp.ClientResponseError):
+        retry_after = parse_retry_after(e.headers.get('Retry-After')) if e.headers else None
+        return e.status in RETRIABLE_STATUS_CODES, e.status, retry_after
+    return False, None, None
+
+
+def classify_batch_error(e):
+    """
+    aiohttp counterpart of client.classify_batch_error.
+    """
+    if isinstance(e, asyncio.TimeoutError):
+        return False, None, None
+    return classify_error(e)
+
+
+def is_batch_too_large(e):
+    """
+    aiohttp counterpart of client.is_batch_too_large.
+    """
+    if isinstance(e, asyncio.TimeoutError):
+        return True
+    return isinstance(e, aiohttp.ClientResponseError) and e.status == REQUEST_ENTITY_TOO_LARGE
+
+
+class AsyncApiClient(object):
+    """
+    aiohttp counterpart of client.ApiClient keeping up to `concurrency` requests in flight,
+    fewer if the server throttles them (see RetryPolicy).
+    company_id and token default to YA_COURIER_COMPANY_ID and YA_COURIER_TOKEN environment variables.
+    Use it as `async with AsyncApiClient() as client`.
+    """
+
+    def __init__(self, company_id=None, token=None, api_url=API_URL, verify=True,
+                 concurrency=CONCURRENCY, timeout=TIMEOUT, codec=None, compress=False):
+        if aiohttp is None:
+            raise RuntimeError('aiohttp is required for the async engine, install ya-courier-helpers[async]')
+        self.company_url = '{}/companies/{}'.format(api_url, get_company_id(company_id))
+        self.token = get_token(token)
+        self.verify = verify
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.codec = get_codec(codec)
+        self.compress = compress
+        self.retry_policy = RetryPolicy(concurrency)
+        self.session = None
+        self.in_flight_changed = None
+
+    async def __aenter__(self):
+        self.in_flight_changed = asyncio.Condition()
+        self.session = aiohttp.ClientSession(
+            headers=get_auth_header(self.token),
+            connector=aiohttp.TCPConnector(limit=self.concurrency, ssl=None if self.verify else False),
+            timeout=aiohttp.ClientTimeout(total=self.timeout)
+        )
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+
+    def url(self, path):
+        return '{}/{}'.format(self.company_url, path)
+
+    async def acquire(self):
+        """
+        Waits for the circuit to close and for a free slot under the adaptive limit, see RetryPolicy.acquire.
+        Returns the time the request is sent at.
+        """
+        while True:
+            wait = self.retry_policy.breaker.wait_time()
+            if not wait:
+                break
+            await asyncio.sleep(wait)
+        async with self.in_flight_changed:
+            policy = self.retry_policy
+            await self.in_flight_changed.wait_for(lambda: policy.in_flight < policy.limit.limit)
+            policy.in_flight += 1
+        return time.monotonic()
+
+    async def release(self):
+        async with self.in_flight_changed:
+            policy = self.retry_policy
+            policy.in_flight -= 1
+            # Waking every waiting request would cost O(waiting) per request
+            self.in_flight_changed.notify(max(0, policy.limit.limit - policy.in_flight))
+
+    async def send(self, method, url, body, headers):
+        start = time.monotonic()
+        try:
+            async with self.session.request(method, url, data=body, headers=headers) as r:
+                content = await r.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            METRICS.observe(method, url, type(e).__name__, time.monotonic() - start, len(body or b''))
+            raise
+        METRICS.observe(method, url, r.status, time.monotonic() - start, len(body or b''), len(content))
+        if r.status >= 400:
+            logging.error(content.decode('utf-8', 'replace'))
+        r.raise_for_status()
+        return self.codec.loads(content)
+
+    async def request(self, url, method, data=None, classify=classify_error):
+        body, headers = encode_body(data, self.codec, self.compress)
+        attempt = 1
+        while True:
+            sent_at = await self.acquire()
+            try:
+                result = await self.send(method, url, body, headers)
+            except Exception as e:
+                retry = self.retry_policy.on_error(e, classify, attempt, sent_at)
+                if retry is None:
+                    raise
+            else:
+                self.retry_policy.on_success(sent_at)
+                return result
+            finally:
+                await self.release()
+
+            delay, attempt = retry
+            await asyncio.sleep(delay)
+            METRICS.add_retry(method, url)
+
+    async def post_request(self, url, data):
+        return await self.request(self.url(url), 'post', data)
+
+    async def post_batch_request(self, url, data, body=None):
+        classify = classify_batch_error if len(data) > 1 else classify_error
+        return await self.request(self.url(url), 'post', data if body is None else body, classify)
+
+    async def get_request(self, url):
+        return await self.request(self.url(url), 'get')
+
+    async def delete_request(self, url):
+        return await self.request(self.url(url), 'delete')
+
+
+async def post_orders(client, data, journal=None, progress=None):
+    j = await client.post_batch_request('orders-batch', data, encode_orders(data))
+    check_orders_uploaded(j, data, journal, progress)
+    return j
+
+
+async def upload_orders(client, batcher, batch, journal=None, progress=None):
+    return await batcher.send_async(partial(post_orders, client, journal=journal, progress=progress), batch,
+                                    is_batch_too_large)
+
+
+async def clear_route_fixed_orders(client, route_id, route_number):
+    try:
+        await client.delete_request('routes/{}/fix-orders'.format(route_id))
+        logging.info('Route {} was cleared from fixed orders'.format(route_number))
+        return True
+    except aiohttp.ClientResponseError as e:
+        if e.status in (422, 500):
+            return False
+        raise
+
+
+async def fix_route_orders(client, route_id, route_number, new_orders, route_orders, journal=None,
+                           fixed_routes=None):
+    old_orders = get_old_orders(route_number, new_orders, route_orders)
+
+    if not await clear_route_fixed_orders(client, route_id, route_number):
+        return
+
+    await client.post_request('routes/{}/fix-orders'.format(route_id), {'orders': old_orders + new_orders})
+    logging.info('Route {} with {}+{} orders was fixed'.format(route_number, len(old_orders), len(new_orders)))
+    if journal:
+        journal.done('fix', [route_number])
+    if fixed_routes:
+        fixed_routes.done(route_number, new_orders)
+
+
+async def fix_uploaded_route(client, task, uploaded, journal=None, fixed_routes=None):
+    await uploaded.wait()
+    await fix_route_orders(client, *task, journal=journal, fixed_routes=fixed_routes)
+
+
+async def upload_orders_and_fix_routes(orders, progress, fix_tasks, batcher, journal=None, fixed_routes=None,
+                                       concurrency=CONCURRENCY, compress=False):
+    """
+    Uploads orders in batches made by batcher and fixes every route of fix_tasks (see get_fix_tasks) as soon as
+    RouteProgress progress has all its orders uploaded.
+    All batches are sent at once, so their sizes only shrink when some of them are too large.
+    """
+    uploaded = {task[1]: asyncio.Event() for task in fix_tasks}
+    for route_number, event in uploaded.items():
+        if progress.is_uploaded(route_number):
+            event.set()
+    progress.on_ready = lambda route_number: uploaded[route_number].set() if route_number in uploaded else None
+
+    async with AsyncApiClient(concurrency=concurrency, compress=compress) as client:
+        fixes = [asyncio.ensure_future(fix_uploaded_route(client, task, uploaded[task[1]], journal, fixed_routes))
+                 for task in fix_tasks]
+        try:
+            with METRICS.stage('orders'):
+                results = await asyncio.gather(*[
+                    upload_orders(client, batcher, batch, journal, progress)
+                    for batch in batcher.batches(orders)
+                ])
+            results = [j for batch_results in results for j in batch_results]
+            logging.info('{} orders batches uploaded: {} inserted, {} updated'.format(
+                len(results), sum(j['inserted'] for j in results), sum(j['updated'] for j in results)))
+
+            with METRICS.stage('fix'):
+                await asyncio.gather(*fixes)
+        finally:
+            for fix in fixes:
+                fix.cancel()
+
+
+async def delete_object(client, url):
+    try:
+        await client.delete_request(url)
+    except aiohttp.ClientResponseError as e:
+        if e.status != 404:
+            raise
+
+
+async def delete_objects(client, urls, name):
+    """
+    Deletes objects by `client.concurrency` worker coroutines taking urls in turn.
+    """
+    urls_left = iter(urls)
+    deleted_count = 0
+
+    async def worker():
+        nonlocal deleted_count
+        for url in urls_left:
+            await delete_object(client, url)
+            deleted_count += 1
+            if deleted_count % CLEAR_PROGRESS_STEP == 0:
+                logging.info('{}/{} {} deleted'.format(deleted_count, len(urls), name))
+
+    workers = [asyncio.ensure_future(worker()) for _ in range(min(client.concurrency, len(urls)))]
+    try:
+        await asyncio.gather(*workers)
+    finally:
+        for w in workers:
+            w.cancel()
+    logging.info('{} {} were deleted'.format(deleted_count, name))
+
+
+async def delete_routes_and_orders(date, concurrency=CONCURRENCY):
+    routes_dict = get_routes(date)
+    order_urls = ['orders/{}'.format(order['id']) for order in get_orders_by_date(date)]
+    logging.info('Found {} routes and {} orders for date {}'.format(len(routes_dict), len(order_urls), date))
+
+    async with AsyncApiClient(concurrency=concurrency) as client:
+        await delete_objects(client, order_urls, 'orders')
+        await delete_objects(client, ['routes/{}'.format(route['id']) for route in routes_dict.values()], 'routes')
+
+    check_date_cleared(date)
+
+    logging.info('DATA DELETED SUCCESSFULLY')
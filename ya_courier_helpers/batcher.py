@@ -0,0 +1,119 @@
+import logging
+import threading
+import time
+
+from ya_courier_helpers.codec import DEFAULT_CODEC
+
+REQUEST_ENTITY_TOO_LARGE = 413
+
+BATCH_TARGET_LATENCY_S = 5
+BATCH_INITIAL_BYTES = 128 * 1024
+BATCH_MIN_BYTES = 4 * 1024
+BATCH_MAX_BYTES = 4 * 1024 * 1024
+BATCH_GROWTH = 2
+
+
+class Batch(list):
+    """
+    Items sent in one request and the size of their serialized JSON.
+    """
+
+    def __init__(self, items=(), nbytes=0):
+        list.__init__(self, items)
+        self.nbytes = nbytes
+
+    def split(self):
+        middle = len(self) // 2
+        return [Batch(part, self.nbytes * len(part) // len(self)) for part in (self[:middle], self[middle:])]
+
+
+class AdaptiveBatcher(object):
+    """
+    Splits items into batches by the size of their serialized JSON. The size grows by BATCH_GROWTH while
+    batches are sent faster than target_latency_s and shrinks in proportion when they are slower.
+    A batch which times out or is rejected as too large is sent again in two halves, and later batches
+    are kept smaller than half of it. Latency includes retries of the batch. Thread safe.
+    size(item) returns bytes the item takes in the batch, its JSON and a comma by default.
+    """
+
+    def __init__(self, target_latency_s=BATCH_TARGET_LATENCY_S, max_items=None, initial_bytes=BATCH_INITIAL_BYTES,
+                 min_bytes=BATCH_MIN_BYTES, max_bytes=BATCH_MAX_BYTES, codec=DEFAULT_CODEC, size=None):
+        self.target_latency_s = target_latency_s
+        self.max_items = max_items
+        self.min_bytes = min_bytes
+        self.max_bytes = max_bytes
+        self.batch_bytes = min(max(initial_bytes, min_bytes), max_bytes)
+        self.codec = codec
+        self.size = size or self.json_size
+        self.lock = threading.Lock()
+
+    def batches(self, items):
+        """
+        Yields Batch lists of items. The size of every batch is taken when it is started,
+        so batches taken lazily follow the latency of the ones sent before.
+        """
+        batch = Batch()
+        for item in items:
+            size = self.size(item)
+            if batch and (batch.nbytes + size > self.batch_bytes or len(batch) == self.max_items):
+                yield batch
+                batch = Batch()
+            batch.append(item)
+            batch.nbytes += size
+        if batch:
+            yield batch
+
+    def json_size(self, item):
+        # A comma separates items in the list
+        return len(self.codec.dumps(item)) + 1
+
+    def on_sent(self, batch, duration):
+        with self.lock:
+            if duration > self.target_latency_s:
+                self.resize(self.batch_bytes * self.target_latency_s / duration)
+            elif batch.nbytes * BATCH_GROWTH > self.batch_bytes:
+                # Batches much smaller than the limit, like the last one, do not show how large batches are sent
+                self.resize(self.batch_bytes * BATCH_GROWTH)
+
+    def on_too_large(self, batch):
+        with self.lock:
+            self.max_bytes = max(self.min_bytes, min(self.max_bytes, batch.nbytes // 2))
+            self.resize(self.batch_bytes)
+        logging.warning('Batch of {} items ({} KB) is too large, splitting it'.format(len(batch), batch.nbytes // 1024))
+
+    def resize(self, nbytes):
+        self.batch_bytes = int(min(max(nbytes, self.min_bytes), self.max_bytes))
+
+    def send(self, func, batch, is_too_large):
+        """
+        Calls func(batch) sending the batch. If it raises an exception for which is_too_large(e) is true,
+        the batch is sent again in two halves. Returns the list of results of func for the parts sent.
+        """
+        start = time.monotonic()
+        try:
+            result = func(batch)
+        except Exception as e:
+            if len(batch) < 2 or not is_too_large(e):
+                raise
+            self.on_too_large(batch)
+            return [r for part in batch.split() for r in self.send(func, part, is_too_large)]
+        self.on_sent(batch, time.monotonic() - start)
+        return [result]
+
+    async def send_async(self, func, batch, is_too_large):
+        """
+        Coroutine counterpart of send for func returning a coroutine.
+        """
+        start = time.monotonic()
+        try:
+            result = await func(batch)
+        except Exception as e:
+            if len(batch) < 2 or not is_too_large(e):
+                raise
+            self.on_too_large(batch)
+            results = []
+            for part in batch.split():
+                results += await self.send_async(func, part, is_too_large)
+            return results
+        self.on_sent(batch, time.monotonic() - start)
+        return [result]
@@ -0,0 +1,169 @@
+import logging
+import time
+import warnings
+
+from ya_courier_helpers.batcher import REQUEST_ENTITY_TOO_LARGE
+from ya_courier_helpers.codec import encode_body, get_codec
+from ya_courier_helpers.config import API_URL, TIMEOUT
+from ya_courier_helpers.metrics import METRICS
+from ya_courier_helpers.retry_policy import RETRIABLE_STATUS_CODES, RetryPolicy, parse_retry_after
+
+POOL_SIZE = 10
+
+
+def get_auth_header(token):
+    return {
+        'Authorization': 'Auth {}'.format(token),
+        'Content-Type': 'application/json'
+    }
+
+
+def classify_error(e):
+    """
+    Returns (retriable, status, retry_after) for an exception raised by a request, see RetryPolicy.call.
+    """
+    import requests
+    if isinstance(e, (requests.exceptions.Timeout, requests.exceptions.ConnectionError)):
+        return True, None, None
+    if isinstance(e, requests.HTTPError) and e.response is not None:
+        status = e.response.status_code
+        return status in RETRIABLE_STATUS_CODES, status, parse_retry_after(e.response.headers.get('Retry-After'))
+    return False, None, None
+
+
+def classify_batch_error(e):
+    """
+    classify_error for requests sending a batch of objects: timeouts are not retried,
+    AdaptiveBatcher sends the batch again in smaller parts instead.
+    """
+    import requests
+    if isinstance(e, requests.exceptions.Timeout):
+        return False, None, None
+    return classify_error(e)
+
+
+def get_batch_classify(data):
+    """
+    Returns classify function for a request sending data list. A single object can not be split,
+    so its timeouts are retried.
+    """
+    return classify_batch_error if len(data) > 1 else classify_error
+
+
+def is_batch_too_large(e):
+    """
+    Tells whether the batch sent by the request raised e should be split, see AdaptiveBatcher.send.
+    """
+    import requests
+    if isinstance(e, requests.exceptions.Timeout):
+        return True
+    return isinstance(e, requests.HTTPError) and e.response is not None and \
+        e.response.status_code == REQUEST_ENTITY_TOO_LARGE
+
+
+class ApiClient(object):
+    """
+    Ya.Courier API client of one company. Keeps a pool of keep-alive connections in its own session,
+    so it can be shared by any number of threads.
+    Request bodies are encoded with `codec` (see ya_courier_helpers.codec) and gzipped if `compress` is set.
+    Failed requests are retried by RetryPolicy shared by all threads, which also keeps the number of requests
+    in flight under what the server accepts.
+    """
+
+    def __init__(self, company_id, token, api_url=API_URL, verify=True, pool_size=POOL_SIZE, timeout=TIMEOUT,
+                 codec=None, compress=False):
+        self.company_id = company_id
+        self.company_url = '{}/companies/{}'.format(api_url, company_id)
+        self.timeout = timeout
+        self.codec = get_codec(codec)
+        self.compress = compress
+        self.retry_policy = RetryPolicy(pool_size)
+
+        # requests takes longer to import than the rest of a tool, so it is imported only when a client is created
+        import requests
+        self.session = requests.Session()
+        self.session.headers.update(get_auth_header(token))
+        self.session.headers['Accept-Encoding'] = 'gzip, deflate'
+        self.session.verify = verify
+        if not verify:
+            warnings.filterwarnings('ignore', 'Unverified HTTPS request')
+        self.set_pool_size(pool_size)
+
+    def set_pool_size(self, size):
+        """
+        Lets up to `size` threads keep their own connection to the same host.
+        """
+        from requests.adapters import HTTPAdapter
+        adapter = HTTPAdapter(pool_connections=size, pool_maxsize=size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.retry_policy.limit.set_max_limit(size)
+
+    def url(self, path):
+        return '{}/{}'.format(self.company_url, path)
+
+    def send(self, method, url, data=None, **kwargs):
+        """
+        Sends a request and returns the response as is.
+        """
+        body, headers = encode_body(data, self.codec, self.compress)
+        start = time.monotonic()
+        try:
+            r = self.session.request(
+                method=method,
+                url=url,
+                data=body,
+                headers=headers,
+                timeout=self.timeout,
+                **kwargs
+            )
+        except Exception as e:
+            METRICS.observe(method, url, type(e).__name__, time.monotonic() - start, len(body or b''))
+            raise
+        received = int(r.headers.get('Content-Length', 0)) if kwargs.get('stream') else len(r.content)
+        METRICS.observe(method, url, r.status_code, time.monotonic() - start, len(body or b''), received)
+        return r
+
+    def call(self, func, method, url, classify=classify_error):
+        """
+        Calls func() sending a request to url, retrying it according to retry_policy.
+        """
+        return self.retry_policy.call(func, classify, on_retry=lambda: METRICS.add_retry(method, url))
+
+    def send_with_retries(self, method, url, data=None, classify=classify_error):
+        """
+        Sends a request retrying it according to retry_policy. Returns the last response as is.
+        """
+        import requests
+
+        def attempt():
+            r = self.send(method, url, data)
+            if r.status_code in RETRIABLE_STATUS_CODES:
+                r.raise_for_status()
+            return r
+
+        try:
+            return self.call(attempt, method, url, classify)
+        except requests.HTTPError as e:
+            return e.response
+
+    def request(self, url, method, data=None, classify=classify_error):
+        return self.call(lambda: self._request(url, method, data), method, url, classify)
+
+    def _request(self, url, method, data):
+        r = self.send(method, url, data)
+        if r.status_code >= 400:
+            logging.error(r.text)
+        r.raise_for_status()
+        return self.codec.loads(r.content)
+
+    def get_stream(self, url):
+        """
+        GETs url without reading the response body. Close the response when done with it.
+        """
+        r = self.send('get', url, stream=True)
+        if r.status_code >= 400:
+            logging.error(r.text)
+            r.close()
+        r.raise_for_status()
+        return r
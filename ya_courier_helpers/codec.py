@@ -0,0 +1,63 @@
+import gzip
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class JsonCodec(object):
+    name = 'json'
+
+    @staticmethod
+    def dumps(data):
+        return json.dumps(data).encode('utf-8')
+
+    @staticmethod
+    def loads(s):
+        return json.loads(s)
+
+
+class OrjsonCodec(object):
+    name = 'orjson'
+
+    @staticmethod
+    def dumps(data):
+        return orjson.dumps(data)
+
+    @staticmethod
+    def loads(s):
+        return orjson.loads(s)
+
+
+CODECS = {codec.name: codec for codec in (JsonCodec, OrjsonCodec)}
+DEFAULT_CODEC = OrjsonCodec if orjson is not None else JsonCodec
+
+# Smaller bodies are sent as is: compressing them saves nothing
+GZIP_MIN_SIZE = 1024
+GZIP_LEVEL = 6
+
+
+def get_codec(name=None):
+    """
+    Returns codec by name, or the fastest installed one if name is not given.
+    """
+    if name is None:
+        return DEFAULT_CODEC
+    if name == OrjsonCodec.name and orjson is None:
+        raise ValueError('orjson is not installed')
+    return CODECS[name]
+
+
+def encode_body(data, codec=DEFAULT_CODEC, compress=False):
+    """
+    Serializes request data, bytes are taken as data already serialized.
+    Returns (body, headers) where headers hold Content-Encoding for gzipped bodies.
+    """
+    if not data:
+        return None, {}
+    body = data if isinstance(data, bytes) else codec.dumps(data)
+    if compress and len(body) >= GZIP_MIN_SIZE:
+        return gzip.compress(body, compresslevel=GZIP_LEVEL), {'Content-Encoding': 'gzip'}
+    return body, {}
@@ -9,21 +9,42 @@ def is_int(s):
         return False
 
 
-API_URL = 'https://courier.yandex.ru/api/v1'
+API_URL = os.environ.get('YA_COURIER_API_URL', 'https://courier.yandex.ru/api/v1')
 
-YA_COURIER_TOKEN = os.environ.get('YA_COURIER_TOKEN')
-if not YA_COURIER_TOKEN:
-    raise ValueError('YA_COURIER_TOKEN environment variable is required')
 
-COMPANY_ID = os.environ.get('YA_COURIER_COMPANY_ID')
-if not COMPANY_ID or not is_int(COMPANY_ID):
-    raise ValueError('COMPANY_ID environment variable is requried')
-else:
-    COMPANY_ID = int(COMPANY_ID)
+def get_token(token=None):
+    """
+    Returns the token given on the command line or YA_COURIER_TOKEN environment variable.
+    """
+    token = token or os.environ.get('YA_COURIER_TOKEN')
+    if not token:
+        raise ValueError('YA_COURIER_TOKEN environment variable is required')
+    return token
+
+
+def get_company_id(company_id=None):
+    """
+    Returns the company id given on the command line or YA_COURIER_COMPANY_ID environment variable.
+    """
+    company_id = company_id or os.environ.get('YA_COURIER_COMPANY_ID')
+    if not company_id or not is_int(company_id):
+        raise ValueError('COMPANY_ID environment variable is requried')
+    return int(company_id)
+
+
+def __getattr__(name):
+    # YA_COURIER_TOKEN and COMPANY_ID are resolved on first access, so that importing the package
+    # does not require them
+    if name == 'YA_COURIER_TOKEN':
+        return get_token()
+    if name == 'COMPANY_ID':
+        return get_company_id()
+    raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
 
 
-YA_COURIER_URL = '{}/companies/{}'.format(API_URL, COMPANY_ID)
-ORDERS_BATCH_API_URL = API_URL + '/companies/{}/orders-batch'
-ORDERS_LIST_API_URL = API_URL + '/companies/{}/orders?date={}'
 TIMEOUT = 60
-MVRP_LOG_URL = 'https://courier.yandex.ru/vrs/api/v1/log/{}/{}'
+MVRP_LOG_URL = os.environ.get('YA_COURIER_MVRP_API_URL', 'https://courier.yandex.ru/vrs/api/v1') + '/log/{}/{}'
+MVRP_LOG_CACHE_DIR = os.environ.get('YA_COURIER_MVRP_LOG_CACHE_DIR')
+MVRP_LOG_CACHE_SIZE_MB = 1024
+DEFAULT_JOURNAL_DIR = os.path.join(os.path.expanduser('~'), '.ya-courier-helpers', 'journal')
+JOURNAL_DIR = os.environ.get('YA_COURIER_JOURNAL_DIR', DEFAULT_JOURNAL_DIR)
@@ -0,0 +1,132 @@
+import glob
+import hashlib
+import json
+import logging
+import os
+import threading
+from datetime import timedelta
+
+MAX_NAME_LEN = 200
+# Days before today whose fixed routes are kept
+FIXED_ROUTES_KEEP_DAYS = 7
+
+
+class UploadJournal(object):
+    """
+    Append-only log of finished upload stages stored as JSON lines.
+    Every line is a stage name with optional items (order numbers, route numbers) finished in it,
+    so an interrupted upload can be resumed regardless of how it was split into requests.
+    """
+
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.lock = threading.Lock()
+        self.stages = {}
+
+        if resume and os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # The last line may be cut if the process was killed while writing it
+                        continue
+                    self.stages.setdefault(entry['stage'], set()).update(entry['items'])
+            logging.info('Resuming upload from journal {}: {}'.format(
+                path, ', '.join('{} ({})'.format(stage, len(items)) for stage, items in self.stages.items())))
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.file = open(path, 'a' if resume else 'w')
+
+    @staticmethod
+    def get_path(directory, task_ids, date):
+        """
+        Journal of several tasks uploaded together is named after all of them, or after their hash
+        if the name gets too long.
+        """
+        if isinstance(task_ids, str):
+            task_ids = [task_ids]
+        name = '+'.join(sorted(task_ids))
+        if len(name) > MAX_NAME_LEN:
+            name = hashlib.sha1(name.encode('utf-8')).hexdigest()
+        return os.path.join(directory, '{}-{}.jsonl'.format(name, date))
+
+    def is_done(self, stage):
+        return stage in self.stages
+
+    def completed(self, stage):
+        return self.stages.get(stage, set())
+
+    def done(self, stage, items=()):
+        items = list(items)
+        with self.lock:
+            self.stages.setdefault(stage, set()).update(items)
+            self.file.write(json.dumps({'stage': stage, 'items': items}) + '\n')
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def close(self, remove=False):
+        self.file.close()
+        if remove:
+            os.remove(self.path)
+
+
+class FixedRoutes(object):
+    """
+    Orders of the routes of a date as they were last fixed by route number, kept in a JSON file per company
+    and date: orders listed from Ya.Courier do not tell their sequence, so --delta compares against these.
+    Routes fixed by an upload are merged into the file by save(), files of past dates are removed by remove_old().
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.fixed = {}
+        self.routes = None
+        if os.path.exists(path):
+            with open(path) as f:
+                self.routes = json.load(f)
+
+    @staticmethod
+    def get_path(directory, company_id, date):
+        return os.path.join(directory, 'fixed-routes-{}-{}.json'.format(company_id, date))
+
+    @staticmethod
+    def remove(path):
+        if os.path.exists(path):
+            os.remove(path)
+
+    @staticmethod
+    def remove_old(directory, today, keep=None, keep_days=FIXED_ROUTES_KEEP_DAYS):
+        """
+        Removes files of dates more than keep_days before today but keep: routes of past days are rarely
+        uploaded again.
+        """
+        oldest = (today - timedelta(days=keep_days)).strftime('%Y-%m-%d')
+        for path in glob.glob(os.path.join(directory, 'fixed-routes-*.json')):
+            # The name ends with YYYY-MM-DD date, such dates are ordered as strings
+            if path != keep and os.path.basename(path)[-len('YYYY-MM-DD.json'):-len('.json')] < oldest:
+                os.remove(path)
+
+    def is_known(self):
+        return self.routes is not None
+
+    def get(self, route_number):
+        return self.routes.get(route_number) if self.routes is not None else None
+
+    def done(self, route_number, orders):
+        with self.lock:
+            self.fixed[route_number] = orders
+
+    def save(self):
+        if not self.fixed:
+            return
+        with self.lock:
+            routes = dict(self.routes or {}, **self.fixed)
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp_path = '{}.{}.tmp'.format(self.path, os.getpid())
+            with open(tmp_path, 'w') as f:
+                json.dump(routes, f)
+            os.replace(tmp_path, self.path)
+            self.routes = routes
+            self.fixed = {}
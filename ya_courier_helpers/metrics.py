@@ -0,0 +1,192 @@
+import json
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+# Upper bounds of request latency histogram buckets, seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+PROMETHEUS_PREFIX = 'ya_courier'
+PROMETHEUS_EXTENSIONS = ('.prom', '.txt')
+
+
+def get_endpoint(url):
+    """
+    Returns url path relative to the company with object ids replaced by {id}: "routes/{id}/fix-orders".
+    MVRP log urls become "log/request" and "log/response".
+    """
+    parts = urlsplit(url).path.strip('/').split('/')
+    if 'companies' in parts:
+        parts = parts[parts.index('companies') + 2:]
+    elif 'log' in parts:
+        parts = parts[parts.index('log'):][:2]
+    return '/'.join('{id}' if p.isdigit() else p for p in parts)
+
+
+class EndpointStats(object):
+    def __init__(self):
+        self.statuses = Counter()
+        self.retries = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.latency_buckets = [0] * len(LATENCY_BUCKETS)
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+
+    @property
+    def calls(self):
+        return sum(self.statuses.values())
+
+    def observe(self, status, duration, bytes_sent, bytes_received):
+        self.statuses[status] += 1
+        self.bytes_sent += bytes_sent
+        self.bytes_received += bytes_received
+        self.latency_sum += duration
+        self.latency_max = max(self.latency_max, duration)
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if duration <= bound:
+                self.latency_buckets[i] += 1
+                break
+
+    def cumulative_buckets(self):
+        total = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.latency_buckets):
+            total += count
+            yield bound, total
+
+    def summary(self):
+        calls = self.calls
+        return OrderedDict([
+            ('calls', calls),
+            ('retries', self.retries),
+            ('statuses', {str(k): v for k, v in sorted(self.statuses.items(), key=lambda x: str(x[0]))}),
+            ('bytes_sent', self.bytes_sent),
+            ('bytes_received', self.bytes_received),
+            ('latency_s', OrderedDict([
+                ('sum', self.latency_sum),
+                ('mean', self.latency_sum / calls if calls else 0),
+                ('max', self.latency_max),
+                ('buckets', OrderedDict([(str(b), n) for b, n in self.cumulative_buckets()] + [('+Inf', calls)])),
+            ])),
+        ])
+
+
+class Metrics(object):
+    """
+    Request statistics per (method, endpoint) and durations of named stages. Thread safe.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = defaultdict(EndpointStats)
+        self.stages = OrderedDict()
+
+    def reset(self):
+        with self.lock:
+            self.endpoints.clear()
+            self.stages.clear()
+
+    def observe(self, method, url, status, duration, bytes_sent=0, bytes_received=0):
+        """
+        Records one request attempt. status is the HTTP status code or the exception class name
+        if no response was received.
+        """
+        key = (method.upper(), get_endpoint(url))
+        with self.lock:
+            self.endpoints[key].observe(status, duration, bytes_sent, bytes_received)
+
+    def add_retry(self, method, url):
+        key = (method.upper(), get_endpoint(url))
+        with self.lock:
+            self.endpoints[key].retries += 1
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Adds time spent in the with block to the stage duration.
+        """
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            duration = time.monotonic() - start
+            with self.lock:
+                self.stages[name] = self.stages.get(name, 0) + duration
+
+    def summary(self):
+        with self.lock:
+            return OrderedDict([
+                ('endpoints', OrderedDict(
+                    ('{} {}'.format(method, endpoint), stats.summary())
+                    for (method, endpoint), stats in sorted(self.endpoints.items())
+                )),
+                ('stages_s', OrderedDict(self.stages)),
+            ])
+
+    def prometheus(self):
+        """
+        Returns metrics in Prometheus text exposition format.
+        """
+        p = PROMETHEUS_PREFIX
+        lines = []
+
+        def metric(name, kind, help_text):
+            lines.append('# HELP {}_{} {}'.format(p, name, help_text))
+            lines.append('# TYPE {}_{} {}'.format(p, name, kind))
+
+        def sample(name, labels, value):
+            label_str = ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                                 for k, v in labels)
+            lines.append('{}_{}{{{}}} {}'.format(p, name, label_str, value))
+
+        with self.lock:
+            endpoints = sorted(self.endpoints.items())
+
+            metric('requests_total', 'counter', 'Request attempts by endpoint and status')
+            for (method, endpoint), stats in endpoints:
+                for status, n in sorted(stats.statuses.items(), key=lambda x: str(x[0])):
+                    sample('requests_total', [('method', method), ('endpoint', endpoint), ('status', status)], n)
+
+            metric('request_retries_total', 'counter',
+                   'Requests retried after connection errors, timeouts, throttling and server errors')
+            for (method, endpoint), stats in endpoints:
+                sample('request_retries_total', [('method', method), ('endpoint', endpoint)], stats.retries)
+
+            metric('request_sent_bytes_total', 'counter', 'Request body bytes sent')
+            for (method, endpoint), stats in endpoints:
+                sample('request_sent_bytes_total', [('method', method), ('endpoint', endpoint)], stats.bytes_sent)
+
+            metric('response_received_bytes_total', 'counter', 'Response body bytes received')
+            for (method, endpoint), stats in endpoints:
+                sample('response_received_bytes_total', [('method', method), ('endpoint', endpoint)],
+                       stats.bytes_received)
+
+            metric('request_duration_seconds', 'histogram', 'Request latency')
+            for (method, endpoint), stats in endpoints:
+                labels = [('method', method), ('endpoint', endpoint)]
+                for bound, n in stats.cumulative_buckets():
+                    sample('request_duration_seconds_bucket', labels + [('le', bound)], n)
+                sample('request_duration_seconds_bucket', labels + [('le', '+Inf')], stats.calls)
+                sample('request_duration_seconds_sum', labels, stats.latency_sum)
+                sample('request_duration_seconds_count', labels, stats.calls)
+
+            metric('stage_duration_seconds', 'gauge', 'Time spent in upload stages')
+            for name, duration in self.stages.items():
+                sample('stage_duration_seconds', [('stage', name)], duration)
+
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """
+        Writes metrics to path: Prometheus text format for .prom and .txt files, JSON otherwise.
+        """
+        if path.endswith(PROMETHEUS_EXTENSIONS):
+            content = self.prometheus()
+        else:
+            content = json.dumps(self.summary(), indent=2) + '\n'
+        with open(path, 'w') as f:
+            f.write(content)
+
+
+METRICS = Metrics()
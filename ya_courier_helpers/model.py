@@ -0,0 +1,78 @@
+class Location(object):
+    """
+    Location of MVRP request with the fields used for uploading orders, defaults are applied.
+    """
+    __slots__ = ('id', 'ref', 'lat', 'lon', 'time_window', 'service_duration_s', 'shared_service_duration_s',
+                 'description', 'title')
+
+    def __init__(self, id, ref, lat, lon, time_window, service_duration_s=0, shared_service_duration_s=0,
+                 description='-', title='-'):
+        self.id = id
+        self.ref = ref
+        self.lat = lat
+        self.lon = lon
+        self.time_window = time_window
+        self.service_duration_s = service_duration_s
+        self.shared_service_duration_s = shared_service_duration_s
+        self.description = description
+        self.title = title
+
+    @classmethod
+    def from_dict(cls, l):
+        return cls(l['id'], l['ref'], l['point']['lat'], l['point']['lon'], l['time_window'],
+                   l.get('service_duration_s', 0), l.get('shared_service_duration_s', 0),
+                   l.get('description', '-'), l.get('title', '-'))
+
+
+class Vehicle(object):
+    __slots__ = ('id', 'ref')
+
+    def __init__(self, id, ref=None):
+        self.id = id
+        self.ref = ref
+
+    @classmethod
+    def from_dict(cls, v):
+        return cls(v['id'], v.get('ref'))
+
+    @property
+    def number(self):
+        return self.ref if self.ref is not None else str(self.id)
+
+
+class Route(object):
+    """
+    Route of MVRP solution: Ya.Courier route number and refs of its orders in visiting order.
+    """
+    __slots__ = ('number', 'vehicle_id', 'shift_id', 'orders')
+
+    def __init__(self, number, vehicle_id, shift_id, orders=None):
+        self.number = number
+        self.vehicle_id = vehicle_id
+        self.shift_id = shift_id
+        self.orders = orders if orders is not None else []
+
+
+class RouteNode(object):
+    """
+    Location visit of a route.
+    """
+    __slots__ = ('route', 'multi_order')
+
+    def __init__(self, route, multi_order):
+        self.route = route
+        self.multi_order = multi_order
+
+
+class Task(object):
+    """
+    MVRP task to upload: depot of the request, its locations and vehicles, SolutionIndex of the solution.
+    """
+    __slots__ = ('depot', 'depot_address', 'locations', 'vehicles', 'index')
+
+    def __init__(self, depot, depot_address, locations, vehicles, index):
+        self.depot = depot
+        self.depot_address = depot_address
+        self.locations = locations
+        self.vehicles = vehicles
+        self.index = index
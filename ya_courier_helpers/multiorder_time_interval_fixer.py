@@ -1,7 +1,16 @@
 import argparse
 from collections import defaultdict
+from datetime import timedelta
+from functools import partial
+from itertools import chain
 
-from ya_courier_helpers.util import orders_batch_upload, orders_list_by_date, date_parser, parse_interval_sec
+from ya_courier_helpers.batcher import AdaptiveBatcher
+from ya_courier_helpers.client import ApiClient, is_batch_too_large
+from ya_courier_helpers.metrics import METRICS
+from ya_courier_helpers.util import orders_batch_upload, iter_orders_by_date, date_parser, parse_interval_sec, \
+    imap_bounded, positive_int
+
+WORKERS = 4
 
 
 def parse_args():
@@ -9,21 +18,43 @@ def parse_args():
 
     parser.add_argument('--company-id', required=True, type=int, help='Your company ID in Ya.Courier')
     parser.add_argument('--token', required=True, help='Your Oauth token in Ya.Courier')
-
-    parser.add_argument('--date', required=True, type=date_parser, help='The date you want to fix')
-
-    return parser.parse_args()
+    parser.add_argument('--gzip', action='store_true', help='Gzip request bodies')
+
+    parser.add_argument('--date', type=date_parser, help='The date you want to fix')
+    parser.add_argument('--date-from', type=date_parser, help='The first date of the range you want to fix')
+    parser.add_argument('--date-to', type=date_parser, help='The last date of the range you want to fix')
+    parser.add_argument('--batch-size', type=positive_int,
+                        help='Maximum number of orders uploaded in one request (default: batches are sized by '
+                             'their bytes and upload time)')
+    parser.add_argument('--workers', type=positive_int, default=WORKERS,
+                        help='Number of requests sent in parallel')
+    parser.add_argument('--metrics-out',
+                        help='Write per-endpoint request metrics to this file: Prometheus text format for .prom and '
+                             '.txt files, JSON otherwise')
+
+    args = parser.parse_args()
+    if args.date:
+        if args.date_from or args.date_to:
+            parser.error('--date can not be used with --date-from/--date-to')
+        args.date_from = args.date_to = args.date
+    elif not args.date_from or not args.date_to:
+        parser.error('either --date or both --date-from and --date-to are required')
+    elif args.date_from > args.date_to:
+        parser.error('--date-from should not be later than --date-to')
+    return args
 
 
 def usage():
     return '\n\tya-courier-multiorder-timeinterval-fixer \\\n' + \
-        '\t--token <YA.COURIER TOKEN> --company-id <YOUR COMPANY ID> --date YYYY-MM-DD\n\n' + \
+        '\t--token <YA.COURIER TOKEN> --company-id <YOUR COMPANY ID> --date YYYY-MM-DD\n' + \
+        '\tor\n' + \
+        '\t--token <YA.COURIER TOKEN> --company-id <YOUR COMPANY ID> --date-from YYYY-MM-DD --date-to YYYY-MM-DD\n\n' + \
         'This tool gets a list of orders for the date and searches for orders with the same phone number.\n If ' + \
         'these orders have different time intervals, it chooses the minimum one and change other orders with it.\n\n' +\
         'For Ya.Courier API documentation visit https://courier.yandex.ru/api/v1/howto\n\n'
 
 
-def fix_time_intervals(orders):
+def fix_time_intervals(orders, date=None):
     # We want different orders for one customer (identified by phone) to have the same time interval so
     # we group orders by phones
 
@@ -52,39 +83,84 @@ def fix_time_intervals(orders):
 
                 for order_time in orders:
                     if order_time['time_interval'] != min_time_interval:
-                        print('{}: {} -> {}'.format(order_time['number'], order_time['time_interval'], min_time_interval))
+                        # Dates are fixed in parallel, so their lines are told apart by the date
+                        print('{}{}: {} -> {}'.format('{}: '.format(date) if date else '', order_time['number'],
+                                                      order_time['time_interval'], min_time_interval))
                         order_time['time_interval'] = min_time_interval
                         fixed_orders.append(order_time)
 
     return fixed_orders
 
 
-def main():
-    args = parse_args()
-    response = orders_list_by_date(args.company_id, args.token, args.date)
+def get_dates(date_from, date_to):
+    return [(date_from + timedelta(days=i)).strftime('%Y-%m-%d') for i in range((date_to - date_from).days + 1)]
+
+
+def get_fixed_orders(client, date):
+    import requests
+    try:
+        return date, fix_time_intervals(iter_orders_by_date(client, date), date)
+    except requests.HTTPError as e:
+        print('{}: Error occured while getting orders by date:'.format(date))
+        print(e.response.status_code)
+        print(e.response.text)
+        return date, None
+
 
+def upload_batch(client, batch):
+    response = orders_batch_upload(client, batch)
     if response.status_code == 200:
-        fixed_orders = fix_time_intervals(response.json())
+        return response.json()['updated'], None
+    return 0, response.text
 
-        if fixed_orders:
-            response = orders_batch_upload(args.company_id, args.token, fixed_orders)
 
-            if response.status_code == 200:
-                print('Data uploaded successfully:\n\tOrders updated: {updated}'.format(**response.json()))
-            else:
-                print('Nothing was changed. Error uploading data:')
-                response_text = response.text
-                print(response_text)
-                if 'psycopg2.IntegrityError' in response_text:
-                    print('Most probably some orders were not created in Ya.Courier')
+def upload_batches(client, batcher, task):
+    date, batch = task
+    return [
+        (date, updated, error)
+        for updated, error in batcher.send(partial(upload_batch, client), batch, is_batch_too_large)
+    ]
 
-        else:
-            print('Empty input data. No multiorders detected.')
 
-    else:
-        print('Error occured while getting orders by date:')
-        print(response.status_code)
-        print(response.text)
+def main():
+    args = parse_args()
+    client = ApiClient(args.company_id, args.token, verify=False, compress=args.gzip, pool_size=args.workers)
+    dates = get_dates(args.date_from, args.date_to)
+
+    with METRICS.stage('fetch'):
+        fixed_orders = dict(imap_bounded(partial(get_fixed_orders, client), dates, args.workers))
+
+    batcher = AdaptiveBatcher(max_items=args.batch_size, codec=client.codec)
+    # Batches are taken lazily, so that their size follows the upload time of the previous ones
+    tasks = (
+        (date, batch)
+        for date in dates if fixed_orders[date]
+        for batch in batcher.batches(fixed_orders[date])
+    )
+    updated = defaultdict(int)
+    errors = defaultdict(list)
+    with METRICS.stage('upload'):
+        for date, count, error in chain.from_iterable(
+                imap_bounded(partial(upload_batches, client, batcher), tasks, args.workers)):
+            updated[date] += count
+            if error is not None:
+                errors[date].append(error)
+    if args.metrics_out:
+        METRICS.write(args.metrics_out)
+
+    for date in dates:
+        if fixed_orders[date] is None:
+            print('{}: Error occured while getting orders by date'.format(date))
+        elif not fixed_orders[date]:
+            print('{}: Empty input data. No multiorders detected.'.format(date))
+        elif not errors[date]:
+            print('{}: Data uploaded successfully:\n\tOrders updated: {}'.format(date, updated[date]))
+        else:
+            print('{}: Error uploading data:\n\tOrders updated: {}'.format(date, updated[date]))
+            for error in errors[date]:
+                print(error)
+                if 'psycopg2.IntegrityError' in error:
+                    print('Most probably some orders were not created in Ya.Courier')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,112 @@
+import logging
+
+MAX_REF_LEN = 80
+# Number of duplicate refs logged with their ids, the rest are only counted
+MAX_LOGGED_DUPLICATES = 20
+
+
+class TaskReport(object):
+    """
+    Result of normalize_task. Counts location refs set from ids and truncated to MAX_REF_LEN,
+    keeps ids of locations and vehicles by their duplicate refs and full refs of different locations
+    by the truncated ref they share.
+    """
+
+    def __init__(self):
+        self.defaulted_refs = 0
+        self.truncated_refs = 0
+        self.duplicate_locations = {}
+        self.duplicate_vehicles = {}
+        self.ref_collisions = {}
+
+    def log(self):
+        if self.defaulted_refs:
+            logging.info('Ids are used as refs of {} locations without them'.format(self.defaulted_refs))
+        if self.truncated_refs:
+            logging.warning('{} refs are truncated to {} characters'.format(self.truncated_refs, MAX_REF_LEN))
+        log_duplicates('locations', self.duplicate_locations)
+        log_duplicates('vehicles', self.duplicate_vehicles)
+
+    def check(self):
+        """
+        Logs the report and raises ValueError if refs of different locations collide after truncation.
+        """
+        self.log()
+        if self.ref_collisions:
+            raise ValueError('{} location refs are the same when truncated to {} characters: {}'.format(
+                len(self.ref_collisions), MAX_REF_LEN, ', '.join(sorted(self.ref_collisions)[:MAX_LOGGED_DUPLICATES])))
+
+
+def log_duplicates(name, duplicates):
+    if not duplicates:
+        return
+    logging.error('{} duplicate refs of {} found: {}'.format(len(duplicates), name, ', '.join(
+        '{} (ids {})'.format(ref, ', '.join(map(str, ids)))
+        for ref, ids in list(duplicates.items())[:MAX_LOGGED_DUPLICATES])))
+
+
+def add_ref(ids, duplicates, ref, id):
+    """
+    Records id of the first object by its ref in ids, adding the id to duplicates when the ref has been seen.
+    """
+    if ref in ids:
+        duplicates.setdefault(ref, [ids[ref]]).append(id)
+    else:
+        ids[ref] = id
+
+
+def normalize_ref(value, report=None):
+    """
+    Sets ref of a location or a route node to its id when it is missing and truncates it to MAX_REF_LEN,
+    counting the changes in report. Returns the ref before truncation.
+    """
+    ref = value.get('ref')
+    if not ref:
+        ref = value['ref'] = str(value['id'])
+        if report is not None:
+            report.defaulted_refs += 1
+    elif len(ref) > MAX_REF_LEN:
+        value['ref'] = ref[:MAX_REF_LEN]
+        if report is not None:
+            report.truncated_refs += 1
+    return ref
+
+
+def normalize_task(request, solution):
+    """
+    Normalizes refs of MVRP request locations and solution route nodes in place and checks them
+    in one pass over each list. Returns TaskReport.
+    """
+    report = TaskReport()
+
+    # Id of the first location by every ref and the first ref of MAX_REF_LEN or longer by its truncated ref:
+    # only such refs can be the same after truncation
+    ids = {}
+    full_refs = {}
+    for loc in request['locations']:
+        ref = loc.get('ref')
+        # Most refs are fine, the call is skipped for them
+        if not ref or len(ref) > MAX_REF_LEN:
+            ref = normalize_ref(loc, report)
+        if len(ref) >= MAX_REF_LEN:
+            short_ref = loc['ref']
+            full_ref = full_refs.setdefault(short_ref, ref)
+            if full_ref != ref:
+                report.ref_collisions.setdefault(short_ref, {full_ref}).add(ref)
+                continue
+        add_ref(ids, report.duplicate_locations, ref, loc['id'])
+
+    for route in solution['routes']:
+        for node in route['route']:
+            value = node['node']['value']
+            ref = value.get('ref')
+            # Most refs are fine, the call is skipped for them
+            if not ref or len(ref) > MAX_REF_LEN:
+                normalize_ref(value)
+
+    ids = {}
+    for v in solution['vehicles']:
+        ref = v.get('ref')
+        add_ref(ids, report.duplicate_vehicles, ref if ref is not None else str(v['id']), v['id'])
+
+    return report
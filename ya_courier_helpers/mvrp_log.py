@@ -0,0 +1,223 @@
+import gzip
+import json
+import logging
+import os
+
+from ya_courier_helpers.codec import GZIP_LEVEL
+
+
+# Field specs describe which parts of MVRP log documents are kept: a dict keeps only listed keys
+# (and applies to every item of a list), KEEP keeps the whole value.
+KEEP = True
+
+REQUEST_FIELDS = {
+    'depot': {
+        'id': KEEP,
+        'ref': KEEP,
+        'point': KEEP,
+        'service_duration_s': KEEP,
+        'time_window': KEEP,
+    },
+    'vehicles': {
+        'id': KEEP,
+        'ref': KEEP,
+    },
+    'locations': {
+        'id': KEEP,
+        'ref': KEEP,
+        'point': KEEP,
+        'time_window': KEEP,
+        'service_duration_s': KEEP,
+        'shared_service_duration_s': KEEP,
+        'description': KEEP,
+        'title': KEEP,
+    },
+    'options': {
+        'date': KEEP,
+    },
+}
+
+RESPONSE_FIELDS = {
+    'result': {
+        'routes': {
+            'vehicle_id': KEEP,
+            'shift': {
+                'id': KEEP,
+            },
+            'route': {
+                'node': {
+                    'type': KEEP,
+                    'value': {
+                        'id': KEEP,
+                        'ref': KEEP,
+                    },
+                },
+                'multi_order': KEEP,
+            },
+        },
+        'vehicles': {
+            'id': KEEP,
+            'ref': KEEP,
+        },
+        'dropped_locations': {
+            'id': KEEP,
+            'ref': KEEP,
+        },
+        'options': {
+            'date': KEEP,
+        },
+    },
+}
+
+
+def prune(value, fields):
+    """
+    Returns a copy of already parsed value with only `fields` left.
+    """
+    if fields is KEEP:
+        return value
+    if isinstance(value, list):
+        return [prune(v, fields) for v in value]
+    if isinstance(value, dict):
+        return {k: prune(v, fields[k]) for k, v in value.items() if k in fields}
+    return value
+
+
+def load_pruned(stream, fields):
+    """
+    Parses JSON document from a binary stream keeping only `fields`.
+    With ijson installed the document is parsed incrementally and skipped values are never built,
+    otherwise it falls back to json.load and pruning afterwards.
+    """
+    try:
+        import ijson
+    except ImportError:
+        return prune(json.load(stream), fields)
+
+    result = None
+    stack = []
+    key = None
+    skip_depth = 0
+
+    for event, value in ijson.basic_parse(stream, use_float=True):
+        if skip_depth:
+            if event in ('start_map', 'start_array'):
+                skip_depth += 1
+            elif event in ('end_map', 'end_array'):
+                skip_depth -= 1
+            continue
+
+        if event == 'map_key':
+            key = value
+            continue
+
+        if event in ('end_map', 'end_array'):
+            stack.pop()
+            continue
+
+        if stack:
+            parent, parent_fields = stack[-1]
+            if parent_fields is KEEP:
+                value_fields = KEEP
+            elif isinstance(parent, list):
+                value_fields = parent_fields
+            elif key in parent_fields:
+                value_fields = parent_fields[key]
+            else:
+                if event in ('start_map', 'start_array'):
+                    skip_depth = 1
+                continue
+        else:
+            parent = None
+            value_fields = fields
+
+        if event == 'start_map':
+            value = {}
+        elif event == 'start_array':
+            value = []
+
+        if parent is None:
+            result = value
+        elif isinstance(parent, list):
+            parent.append(value)
+        else:
+            parent[key] = value
+
+        if event in ('start_map', 'start_array'):
+            stack.append((value, value_fields))
+
+    return result
+
+
+class MvrpLogCache(object):
+    """
+    Gzip-compressed MVRP logs stored in a directory by task id.
+    When the total size exceeds max_size bytes the least recently used logs are removed, except the logs got
+    or put by this cache: downloads run in parallel and another one may evict a log before it is opened.
+    """
+
+    SUFFIX = '.json.gz'
+
+    def __init__(self, directory, max_size):
+        self.directory = directory
+        self.max_size = max_size
+        self.used = set()
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, kind, task_id):
+        return os.path.join(self.directory, '{}-{}{}'.format(kind, task_id, self.SUFFIX))
+
+    def get(self, kind, task_id):
+        """
+        Returns path to the cached log or None.
+        """
+        path = self.path(kind, task_id)
+        self.used.add(path)
+        if not os.path.exists(path):
+            return None
+        os.utime(path)
+        return path
+
+    def open(self, path):
+        return gzip.open(path, 'rb')
+
+    def put(self, kind, task_id, chunks):
+        path = self.path(kind, task_id)
+        self.used.add(path)
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        try:
+            # The default level 9 is several times slower for a few percent smaller logs
+            with gzip.open(tmp_path, 'wb', compresslevel=GZIP_LEVEL) as f:
+                for chunk in chunks:
+                    f.write(chunk)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self.evict()
+        return path
+
+    def evict(self):
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith(self.SUFFIX):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    # Evicted by a concurrent download
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+
+        total_size = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total_size <= self.max_size:
+                break
+            if path in self.used:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+            logging.info('MVRP log {} was evicted from cache'.format(path))
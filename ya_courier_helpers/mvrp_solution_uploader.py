@@ -1,19 +1,41 @@
 import argparse
-import json
-from collections import defaultdict
+import queue
+import threading
+from collections import Counter, defaultdict
+from datetime import datetime
+from functools import partial
+from itertools import chain
 from multiprocessing.dummy import Pool
 
-import requests
 import logging
 
-from ya_courier_helpers.util import chunks, get_duplicates, post_request, \
-    get_request, delete_request, get_mvrp_request, get_mvrp_solution, valid_date
+from ya_courier_helpers.util import get_duplicates, post_request, post_batch_request, \
+    get_request, delete_request, get_mvrp_request, get_mvrp_solution, valid_date, positive_int, \
+    set_pool_size, parse_interval_sec, iter_pages, get_client, imap_bounded
+from ya_courier_helpers.batcher import AdaptiveBatcher
+from ya_courier_helpers.client import is_batch_too_large
+from ya_courier_helpers.config import MVRP_LOG_CACHE_DIR, MVRP_LOG_CACHE_SIZE_MB, JOURNAL_DIR, DEFAULT_JOURNAL_DIR, \
+    get_company_id
+from ya_courier_helpers.journal import FixedRoutes, UploadJournal
+from ya_courier_helpers.metrics import METRICS
+from ya_courier_helpers.model import Location, Task, Vehicle
+from ya_courier_helpers.mvrp_check import normalize_task
+from ya_courier_helpers.mvrp_log import MvrpLogCache
+from ya_courier_helpers.payload import build_order, encode_orders, encoded_size, is_uploadable, iter_encoded_orders
+from ya_courier_helpers.payload import start_build_pool
+from ya_courier_helpers.scheduler import StageScheduler
+from ya_courier_helpers.solution_index import SolutionIndex
 
 FORMAT = '%(asctime)-15s %(levelname)-8s %(message)s'
 logging.basicConfig(format=FORMAT, level=logging.INFO)
 
 
-MAX_REF_LEN = 80
+CLEAR_WORKERS = 32
+CLEAR_PROGRESS_STEP = 1000
+DELTA_FIELDS = ('address', 'phone', 'service_duration_s', 'customer_name', 'weight')
+COORDINATES_TOLERANCE = 1e-6
+ENGINE_THREADS = 'threads'
+ENGINE_ASYNC = 'async'
 
 
 def get_routes(date):
@@ -21,12 +43,18 @@ def get_routes(date):
     return {x['number']: x for x in routes}
 
 
-def get_orders(route_id):
-    orders = get_request('orders?route_id={}'.format(route_id))
-    return {x['number']: x for x in orders}
+def iter_orders(query):
+    return iter_pages(lambda page: get_request('orders?{}&page={}'.format(query, page)))
 
 
-def upload_depot(depot, depot_address):
+def get_orders_by_date(date):
+    """
+    Yields orders of the date page by page.
+    """
+    return iter_orders('date={}'.format(date))
+
+
+def build_depot(depot, depot_address):
     data = {
         'number': depot.get('ref', str(depot['id'])),
         'name': depot.get('ref', str(depot['id'])),
@@ -41,242 +69,608 @@ def upload_depot(depot, depot_address):
     if 'time_window' in depot:
         data['time_interval'] = depot['time_window']
 
-    j = post_request('depots-batch', [data])
-    assert j['inserted'] + j['updated'] == 1
-    logging.info('Depot uploaded')
+    return data
 
 
-def upload_couriers(couriers):
-    j = post_request('couriers-batch', [{'number': c.get('ref', str(c['id'])), 'name': c['ref']} for c in couriers])
-    assert j['inserted'] + j['updated'] == len(couriers)
-    logging.info('{} couriers uploaded'.format(len(couriers)))
+def upload_depots(depots):
+    """
+    Uploads (depot, depot_address) pairs, a depot shared by several tasks is uploaded once.
+    """
+    data = {}
+    for depot, depot_address in depots:
+        d = build_depot(depot, depot_address)
+        data.setdefault(d['number'], d)
+    data = list(data.values())
 
+    j = post_request('depots-batch', data)
+    assert j['inserted'] + j['updated'] == len(data)
+    logging.info('{} depots uploaded'.format(len(data)))
 
-def upload_routes(solution, depot):
-    veh_dict = {
-        v['id']: v for v in solution['vehicles']
-    }
 
-    j = post_request('routes-batch', [
-        {
-            'number': '{}-{}-{}'.format(veh_dict[r['vehicle_id']]['ref'], r['shift']['id'],
-                                        solution['options']['date']),
-            'date': solution['options']['date'],
-            'depot_number': depot.get('ref', str(depot['id'])),
-            'courier_number': veh_dict[r['vehicle_id']].get('ref', str(r['vehicle_id']))
-        } for r in solution['routes']
-    ])
-    assert j['inserted'] + j['updated'] == len(solution['routes'])
-    logging.info('{} routes uploaded for date {}'.format(len(solution['routes']), solution['options']['date']))
-
-
-def upload_orders(locations, solution, orders_dict, phone):
-    loc2veh = {}
-    loc2shift = {}
-    loc2multi = {}
-    for route in solution['routes']:
-        for loc in route['route']:
-            if loc['node']['type'] == 'location':
-                loc2veh[loc['node']['value']['id']] = route['vehicle_id']
-                loc2shift[loc['node']['value']['id']] = route['shift']['id']
-                loc2multi[loc['node']['value']['id']] = loc['multi_order']
-
-    veh_dict = {
-        v['id']: v for v in solution['vehicles']
-    }
+def upload_depot(depot, depot_address):
+    upload_depots([(depot, depot_address)])
+
+
+def upload_couriers(couriers):
+    """
+    Uploads Vehicle records as couriers, a vehicle of several tasks is uploaded once.
+    """
+    data = list({c.number: {'number': c.number, 'name': c.number} for c in couriers}.values())
+    j = post_request('couriers-batch', data)
+    assert j['inserted'] + j['updated'] == len(data)
+    logging.info('{} couriers uploaded'.format(len(data)))
 
-    dropped_locations = {l['id']: l for l in solution['dropped_locations']}
-    dropped_count = 0
-    skipped_count = 0
 
-    data = []
+def upload_routes(index, depot, skip_route_numbers=()):
+    data = [
+        {
+            'number': route.number,
+            'date': index.date,
+            'depot_number': depot.get('ref', str(depot['id'])),
+            'courier_number': index.courier_number(route.vehicle_id)
+        } for route in index.routes
+        if route.number not in skip_route_numbers
+    ]
+    if not data:
+        logging.info('No routes to upload for date {}'.format(index.date))
+        return
+
+    j = post_request('routes-batch', data)
+    assert j['inserted'] + j['updated'] == len(data)
+    logging.info('{} routes uploaded for date {}'.format(len(data), index.date))
+
+
+class RouteProgress(object):
+    """
+    Numbers of orders left to upload by route number. on_ready(route_number) is called once all orders
+    of a route are uploaded. Thread safe.
+    """
+
+    def __init__(self, task_locations, on_ready=None):
+        self.pending = Counter(
+            index.nodes[l.id].route.number
+            for locations, index in task_locations
+            for l in locations if is_uploadable(l, index)
+        )
+        self.on_ready = on_ready
+        self.lock = threading.Lock()
+
+    def is_uploaded(self, route_number):
+        with self.lock:
+            return not self.pending[route_number]
+
+    def uploaded(self, orders):
+        ready = []
+        with self.lock:
+            for order in orders:
+                number = order.route_number
+                self.pending[number] -= 1
+                if not self.pending[number]:
+                    ready.append(number)
+        if self.on_ready:
+            for number in ready:
+                self.on_ready(number)
+
+
+def check_orders_uploaded(j, data, journal=None, progress=None):
+    assert j['inserted'] + j['updated'] == len(data), 'Requested: {}, Updated: {}, Inserted: {}'.format(len(data),
+                                                                                                       j['updated'],
+                                                                                                       j['inserted'])
+    logging.info('{} orders uploaded'.format(len(data)))
+    if journal:
+        journal.done('orders', [order.number for order in data])
+    if progress:
+        progress.uploaded(data)
+
+
+def post_orders(data, journal=None, progress=None):
+    j = post_batch_request('orders-batch', data, encode_orders(data))
+    check_orders_uploaded(j, data, journal, progress)
+    return j
+
+
+def upload_orders(batcher, batch, journal=None, progress=None):
+    """
+    Uploads a batch of orders made by batcher. Returns responses of the requests sent, see AdaptiveBatcher.send.
+    """
+    return batcher.send(partial(post_orders, journal=journal, progress=progress), batch, is_batch_too_large)
+
+
+def same_time_interval(a, b):
+    if a == b:
+        return True
+    try:
+        return parse_interval_sec(a) == parse_interval_sec(b)
+    except (ValueError, IndexError):
+        return False
+
+
+def is_order_changed(order, current_order, route_id):
+    if current_order.get('route_id') != route_id:
+        return True
+    for field in DELTA_FIELDS:
+        if order[field] != current_order.get(field):
+            return True
+    for field in ('lat', 'lon'):
+        if current_order.get(field) is None or abs(order[field] - current_order[field]) > COORDINATES_TOLERANCE:
+            return True
+    return not same_time_interval(order['time_interval'], current_order.get('time_interval'))
+
+
+def get_delta(locations, index, orders_dict, phone, current_orders, routes_dict):
+    """
+    Compares solution orders with orders currently uploaded for the date.
+    Returns locations to upload and numbers of routes to fix again. Locations which can't be uploaded are kept
+    so that iter_encoded_orders reports them.
+    """
+    route_numbers = {route['id']: number for number, route in routes_dict.items()}
+
+    changed_locations = []
+    changed_route_numbers = set()
     for l in locations:
-        if l['id'] in loc2veh and not l['ref'].startswith('respawn_') and not l['ref'].startswith('FAKE'):
-            data.append({
-                'number': l['ref'],
-                'lat': l['point']['lat'],
-                'lon': l['point']['lon'],
-                'address': l.get('description', '-'),
-                'phone': orders_dict[l['ref']].get('customer_phone', phone),
-                'service_duration_s': 0 if loc2multi[l['id']]
-                                        else l.get('service_duration_s', 0) + l.get('shared_service_duration_s', 0),
-                'status': 'confirmed',
-                'customer_name': l.get('title', '-'),
-                'weight': orders_dict[l['ref']].get('weight_kg', 0),
-                'time_interval': l['time_window'],
-                'route_number': '{}-{}-{}'.format(veh_dict[loc2veh[l['id']]]['ref'], loc2shift[l['id']],
-                                                  solution['options']['date'])
-            })
-        elif l['id'] in dropped_locations:
-            dropped_count += 1
-            logging.error('Order {} is dropped. Skipping it.'.format(dropped_locations[l['id']]['ref']))
-        else:
-            skipped_count += 1
-            logging.error('Order {} was skipped.'.format(l['ref']))
+        if not is_uploadable(l, index):
+            changed_locations.append(l)
+            continue
+
+        order = build_order(l, index, orders_dict, phone)
+        current_order = current_orders.get(order['number'])
+        if current_order is None or is_order_changed(order, current_order, routes_dict[order['route_number']]['id']):
+            changed_locations.append(l)
+            changed_route_numbers.add(order['route_number'])
+            if current_order is not None and current_order.get('route_id') in route_numbers:
+                changed_route_numbers.add(route_numbers[current_order['route_id']])
+
+    return changed_locations, changed_route_numbers
+
+
+def get_old_orders(route_number, new_orders, route_orders):
+    """
+    Returns orders which are in the route in Ya.Courier but not in the solution.
+    """
+    new_orders_set = set(new_orders)
+    logging.info(','.join(new_orders))
+    logging.info('Got {} new orders in route {}'.format(len(new_orders), route_number))
+
+    old_orders = [
+        x['number']
+        for x in route_orders
+        if x['number'] not in new_orders_set
+    ]
+    logging.info(','.join(old_orders))
+    logging.info('Found {} old orders in route {}'.format(len(old_orders), route_number))
+    return old_orders
+
+
+def fix_route_orders(route_id, route_number, new_orders, route_orders, journal=None, fixed_routes=None):
+    old_orders = get_old_orders(route_number, new_orders, route_orders)
+
+    if not clear_route_fixed_orders(route_id, route_number):
+        return
+
+    post_request(
+        url='routes/{}/fix-orders'.format(route_id),
+        data={'orders': old_orders + new_orders}
+    )
+    logging.info('Route {} with {}+{} orders was fixed'.format(route_number, len(old_orders), len(new_orders)))
+    if journal:
+        journal.done('fix', [route_number])
+    if fixed_routes:
+        fixed_routes.done(route_number, new_orders)
+
+
+def group_other_orders(indexes, orders):
+    """
+    Returns orders which are not in the solutions with SolutionIndex indexes by route id. Orders of the solutions
+    are fixed as new orders of their routes, and the upload may move them from the routes they are listed in.
+    """
+    solution_orders = {ref for index in indexes for route in index.routes for ref in route.orders}
+    orders_by_route = defaultdict(list)
+    for order in orders:
+        if order['number'] not in solution_orders:
+            orders_by_route[order['route_id']].append(order)
+    return orders_by_route
+
+
+def get_fix_tasks(indexes, route_numbers=None, journal=None, other_orders=None):
+    """
+    Returns (route_id, route_number, new_orders, route_orders) for every route to fix of the solutions
+    solved for the same date. other_orders are orders of the date grouped by group_other_orders,
+    they are listed once the orders are uploaded if not given.
+    """
+    date = indexes[0].date
+    routes_dict = get_routes(date)
+    if other_orders is None:
+        other_orders = group_other_orders(indexes, get_orders_by_date(date))
 
-    j = post_request('orders-batch', data)
-    assert j['inserted'] + j['updated'] == len(
-        locations) - dropped_count - skipped_count, 'Requested: {}, Updated: {}, Inserted: {}'.format(len(locations),
-                                                                                                      j['updated'],
-                                                                                                      j['inserted'])
-    logging.info('{} locations uploaded'.format(len(locations)))
+    tasks = []
+    for index in indexes:
+        for route in index.routes:
+            if route_numbers is not None and route.number not in route_numbers:
+                continue
+            if journal and route.number in journal.completed('fix'):
+                continue
+            route_id = routes_dict[route.number]['id']
+            tasks.append((route_id, route.number, route.orders, other_orders.get(route_id, [])))
+    return tasks
+
+
+def fix_uploaded_routes(fix_tasks, progress, ready_routes, workers=1, journal=None, fixed_routes=None):
+    """
+    Fixes every route of fix_tasks once RouteProgress progress has all its orders uploaded, taking numbers
+    of the routes as they get ready from ready_routes queue. None in the queue means no more routes get ready.
+    """
+    pending = {task[1]: task for task in fix_tasks}
+    fix_kwargs = {'journal': journal, 'fixed_routes': fixed_routes}
+    with Pool(workers) as p:
+        results = []
+
+        def fix(route_number):
+            task = pending.pop(route_number, None)
+            if task:
+                results.append(p.apply_async(fix_route_orders, task, fix_kwargs))
+
+        for route_number in list(pending):
+            if progress.is_uploaded(route_number):
+                fix(route_number)
+        while pending:
+            route_number = ready_routes.get()
+            if route_number is None:
+                break
+            fix(route_number)
+
+        for result in results:
+            result.get()
+    if pending:
+        logging.error('{} routes were not fixed: their orders are not uploaded'.format(len(pending)))
+
+
+def clear_route_fixed_orders(route_id, route_number):
+    import requests
+    try:
+        delete_request(
+            url='routes/{}/fix-orders'.format(route_id)
+        )
+        logging.info('Route {} was cleared from fixed orders'.format(route_number))
+        return True
+    except requests.HTTPError as e:
+        if e.response.status_code in (422, 500):
+            return False
+        else:
+            raise
 
 
-def fix_orders(solution):
-    veh_dict = {
-        v['id']: v for v in solution['vehicles']
-    }
+def clear_fixed_orders(index, workers=1):
+    routes_dict = get_routes(index.date)
 
-    routes_dict = get_routes(solution['options']['date'])
-
-    for r in solution['routes']:
-        route_number = '{}-{}-{}'.format(veh_dict[r['vehicle_id']]['ref'], r['shift']['id'],
-                                         solution['options']['date'])
-        route_id = routes_dict[route_number]['id']
-        new_orders = [
-            x['node']['value']['ref']
-            for x in r['route']
-            if x['node']['type'] == 'location'
-            and not x['node']['value']['ref'].startswith('respawn_')
-            and not x['node']['value']['ref'].startswith('FAKE')
-        ]
-        logging.info(','.join(new_orders))
-        logging.info('Got {} new orders in route {}'.format(len(new_orders), route_number))
-
-        j = get_request(
-            url='orders?route_id={}'.format(route_id)
-        )
+    tasks = [
+        (routes_dict[route_number]['id'], route_number)
+        for route_number in index.route_numbers
+        if route_number in routes_dict
+    ]
 
-        order_numbers_dict = {str(o['id']): o['number'] for o in j}
+    with Pool(workers) as p:
+        p.starmap(clear_route_fixed_orders, tasks)
 
-        # logging.info([order_numbers_dict[str(x['id'])] for x in j])
-        # logging.info(new_orders)
-        old_orders = [
-            order_numbers_dict[str(x['id'])]
-            for x in j
-            if order_numbers_dict[str(x['id'])] not in new_orders
-        ]
-        logging.info(','.join(old_orders))
-        logging.info('Found {} old orders in route {}'.format(len(old_orders), route_number))
 
-        try:
-            delete_request(
-                url='routes/{}/fix-orders'.format(route_id)
-            )
-            logging.info('Route {} was cleared from fixed orders'.format(route_number))
-        except requests.HTTPError as e:
-            if e.response.status_code in (422, 500):
-                continue
-            else:
-                raise
+def delete_object(url):
+    """
+    Deletes an object, one already deleted counts as deleted. Retries are made by the client's RetryPolicy.
+    """
+    import requests
+    try:
+        delete_request(url)
+    except requests.HTTPError as e:
+        if e.response.status_code != 404:
+            raise
 
-        post_request(
-            url='routes/{}/fix-orders'.format(route_id),
-            data={'orders': old_orders + new_orders}
-        )
-        logging.info('Route {} with {}+{} orders was fixed'.format(route_number, len(old_orders), len(new_orders)))
 
+def delete_objects(urls, workers, name):
+    deleted_count = 0
+    with Pool(workers) as p:
+        for _ in p.imap_unordered(delete_object, urls):
+            deleted_count += 1
+            if deleted_count % CLEAR_PROGRESS_STEP == 0:
+                logging.info('{}/{} {} deleted'.format(deleted_count, len(urls), name))
 
-def clear_fixed_orders(solution):
-    veh_dict = {
-        v['id']: v for v in solution['vehicles']
-    }
+    logging.info('{} {} were deleted'.format(deleted_count, name))
 
-    routes_dict = get_routes(solution['options']['date'])
-
-    for r in solution['routes']:
-        route_number = '{}-{}'.format(veh_dict[r['vehicle_id']]['ref'], solution['options']['date'])
-        if route_number in routes_dict:
-            route_id = routes_dict[route_number]['id']
-            try:
-                delete_request(
-                    url='routes/{}/fix-orders'.format(route_id)
-                )
-                logging.info('Route {} was cleared from fixed orders'.format(route_number))
-            except requests.HTTPError as e:
-                if e.response.status_code in (422, 500):
-                    continue
-                else:
-                    raise
-
-
-def delete_route_and_orders(args):
-    route_number, route = args
-    orders_dict = get_orders(route['id'])
-
-    for order_number, order in orders_dict.items():
-        delete_request(
-            url='orders/{}'.format(order['id'])
-        )
-    logging.info('{} orders from route {} were deleted'.format(len(orders_dict), route_number))
 
-    delete_request(
-        url='routes/{}'.format(route['id'])
-    )
-    logging.info('Route {} was deleted'.format(route_number))
+def check_date_cleared(date):
+    remaining_routes = len(get_routes(date))
+    remaining_orders = sum(1 for _ in get_orders_by_date(date))
+    assert not remaining_routes and not remaining_orders, \
+        '{} routes and {} orders are left for date {}'.format(remaining_routes, remaining_orders, date)
 
 
-def delete_routes_and_orders(date):
+def delete_routes_and_orders(date, workers=CLEAR_WORKERS):
     routes_dict = get_routes(date)
-    logging.info('Found {} routes for date {}'.format(len(routes_dict), date))
+    # Listing pages shift while orders are deleted, so all of them are listed first
+    order_urls = ['orders/{}'.format(order['id']) for order in get_orders_by_date(date)]
+    logging.info('Found {} routes and {} orders for date {}'.format(len(routes_dict), len(order_urls), date))
 
-    with Pool(10) as p:
-        p.map(delete_route_and_orders, routes_dict.items())
+    set_pool_size(workers)
+    delete_objects(order_urls, workers, 'orders')
+    delete_objects(['routes/{}'.format(route['id']) for route in routes_dict.values()], workers, 'routes')
 
-    logging.info('DATA DELETED SUCCESSFULLY')
+    check_date_cleared(date)
 
+    logging.info('DATA DELETED SUCCESSFULLY')
 
-def assert_solution(s):
-    couriers_nums = [v['ref'] for v in s['vehicles']]
-    duplicate_vehicle_nums = get_duplicates(couriers_nums)
-    if duplicate_vehicle_nums:
-        logging.error('Duplicate vehicles found: {}'.format(duplicate_vehicle_nums))
-        for v in s['vehicles']:
-            if v['ref'] == duplicate_vehicle_nums[0]:
-                logging.error(json.dumps(v, indent=4))
 
+def check_tasks_overlap(tasks):
+    duplicate_route_nums = get_duplicates([route.number for task in tasks for route in task.index.routes])
+    if duplicate_route_nums:
+        raise ValueError('Routes found in several tasks: {}'.format(duplicate_route_nums))
 
-def assert_request(r):
-    orders_nums = [l['ref'] for l in r['locations']]
-    duplicate_loc_nums = get_duplicates(orders_nums)
+    duplicate_loc_nums = get_duplicates([ref for task in tasks for ref in {l.ref for l in task.locations}])
     if duplicate_loc_nums:
-        logging.error('Duplicate locations found: {}'.format(duplicate_loc_nums))
-        for l in r['locations']:
-            if l['ref'] == duplicate_loc_nums[0]:
-                logging.error(json.dumps(l, indent=4))
+        raise ValueError('Locations found in several tasks: {}'.format(duplicate_loc_nums))
 
 
-def upload_data(solver_request, solver_solution, orders_dict, depot_address, date=None, phone='+71111111111'):
-    r = solver_request
-    s = solver_solution
+def upload_data(solver_request, solver_solution, orders_dict, depot_address, date=None, phone='+71111111111',
+                upload_workers=1, fix_workers=1, delta=False, journal=None, engine=ENGINE_THREADS,
+                concurrency=None, batch_size=None, build_workers=1, fixed_routes=None):
+    upload_tasks([(solver_request, solver_solution, depot_address)], orders_dict, date, phone, upload_workers,
+                 fix_workers, delta, journal, engine, concurrency, batch_size, build_workers, fixed_routes)
 
-    assert_request(r)
-    assert_solution(s)
+
+def load_task(solver_request, solver_solution, depot_address, date=None):
+    """
+    Normalizes and checks MVRP request and solution and keeps the data uploaded from them in a Task.
+    """
+    normalize_task(solver_request, solver_solution).check()
 
     if date:
-        s['options']['date'] = date
-        r['options']['date'] = date
+        solver_solution['options']['date'] = date
+        solver_request['options']['date'] = date
+
+    return Task(solver_request['depot'], depot_address,
+                [Location.from_dict(l) for l in solver_request['locations']],
+                [Vehicle.from_dict(v) for v in solver_request['vehicles']],
+                SolutionIndex(solver_solution))
+
+
+def upload_tasks(tasks, orders_dict, date=None, phone='+71111111111', upload_workers=1, fix_workers=1, delta=False,
+                 journal=None, engine=ENGINE_THREADS, concurrency=None, batch_size=None, build_workers=1,
+                 fixed_routes=None):
+    """
+    Uploads (solver_request, solver_solution, depot_address) of MVRP tasks solved for the same date.
+    tasks may be an iterator: every task is converted to a Task first, so its request and solution
+    can be freed while the upload goes on.
+    Depots and couriers of all tasks are uploaded in one request each, orders and routes fixing of all tasks
+    share upload_workers and fix_workers. Orders are uploaded in batches of up to batch_size orders
+    sized by AdaptiveBatcher. Orders are built and serialized by build_workers processes, see start_build_pool.
+    Stages run on StageScheduler: depot, couriers and listing of the orders of the date run together, orders
+    are uploaded after routes, and every route is fixed as soon as its orders are uploaded.
+    Routes fixed by the upload are recorded in FixedRoutes fixed_routes. With delta routes whose orders changed
+    or whose sequence differs from the recorded one are fixed, all routes if they are not known.
+    """
+    tasks = [load_task(r, s, depot_address, date) for r, s, depot_address in tasks]
+
+    indexes = [task.index for task in tasks]
+    dates = sorted({index.date for index in indexes})
+    if len(dates) > 1:
+        raise ValueError('Tasks are solved for different dates: {}, use --date'.format(', '.join(dates)))
+    date = dates[0]
+    if len(tasks) > 1:
+        check_tasks_overlap(tasks)
+
+    logging.info('Uploading data for date: {}'.format(date))
+
+    if max(upload_workers, fix_workers) > 1:
+        # Routes are fixed while orders are uploaded
+        set_pool_size(upload_workers + fix_workers)
+
+    # (locations, index) of every task
+    task_locations = [(task.locations, task.index) for task in tasks]
+    # Orders of the date listed before the upload, by number with delta and by route otherwise
+    current_orders = None
+    fix_route_numbers = None
+    ready_routes = queue.Queue()
+    progress = None
+
+    def upload_depots_stage():
+        if journal and journal.is_done('depot'):
+            logging.info('Depot is already uploaded')
+            return
+        upload_depots([(task.depot, task.depot_address) for task in tasks])
+        if journal:
+            journal.done('depot')
+
+    def upload_couriers_stage():
+        if journal and journal.is_done('couriers'):
+            logging.info('Couriers are already uploaded')
+            return
+        upload_couriers([
+            v
+            for task in tasks
+            for v in task.vehicles if v.id in task.index.route_vehicle_ids
+        ])
+        if journal:
+            journal.done('couriers')
+
+    def list_orders_stage():
+        nonlocal current_orders
+        orders = get_orders_by_date(date)
+        current_orders = {o['number']: o for o in orders} if delta else group_other_orders(indexes, orders)
+
+    def upload_routes_stage():
+        nonlocal current_orders, fix_route_numbers, progress
+        if delta:
+            routes_dict = get_routes(date)
+            for task in tasks:
+                upload_routes(task.index, task.depot, skip_route_numbers=routes_dict)
+            if not routes_dict.keys() >= {n for index in indexes for n in index.route_numbers}:
+                routes_dict = get_routes(date)
+            fix_route_numbers = set()
+            for i, (locations, index) in enumerate(task_locations):
+                locations, route_numbers = get_delta(locations, index, orders_dict, phone, current_orders,
+                                                     routes_dict)
+                task_locations[i] = (locations, index)
+                fix_route_numbers |= route_numbers
+            known = fixed_routes is not None and fixed_routes.is_known()
+            fix_route_numbers |= {
+                route.number
+                for index in indexes
+                for route in index.routes if not known or fixed_routes.get(route.number) != route.orders
+            }
+            # Locations which can't be uploaded are kept to be reported, they are not changed
+            logging.info('{} of {} locations and {} of {} routes changed'.format(
+                sum(is_uploadable(l, index) for locations, index in task_locations for l in locations),
+                sum(len(task.locations) for task in tasks),
+                len(fix_route_numbers), sum(len(index.routes) for index in indexes)))
+            current_orders = group_other_orders(indexes, current_orders.values())
+        elif journal and journal.is_done('routes'):
+            logging.info('Routes are already uploaded')
+        else:
+            for task in tasks:
+                upload_routes(task.index, task.depot)
+        if journal:
+            journal.done('routes')
+
+        if journal and journal.is_done('orders'):
+            uploaded_orders = journal.completed('orders')
+            task_locations[:] = [
+                ([l for l in locations if l.ref not in uploaded_orders], index)
+                for locations, index in task_locations
+            ]
+            logging.info('{} orders are already uploaded'.format(len(uploaded_orders)))
+        progress = RouteProgress(task_locations, on_ready=ready_routes.put)
+
+    def get_fix_tasks_stage():
+        if fix_route_numbers is not None and not fix_route_numbers:
+            logging.info('No routes to fix')
+            return []
+        return get_fix_tasks(indexes, fix_route_numbers, journal, current_orders)
+
+    # Workers are forked before the stages start any threads, with all locations of the tasks
+    build_pool = start_build_pool(task_locations, orders_dict, phone, get_client().codec, build_workers)
+    # Orders are built while batches are taken, once the routes stage has left the locations to upload
+    orders = iter_encoded_orders(task_locations, orders_dict, phone, get_client().codec, build_workers, build_pool)
+    batcher = AdaptiveBatcher(max_items=batch_size, codec=get_client().codec, size=encoded_size)
+
+    def upload_orders_stage():
+        upload_batch = partial(upload_orders, batcher, journal=journal, progress=progress)
+        try:
+            # Batches are taken lazily, so that their size follows the upload time of the previous ones
+            if upload_workers > 1:
+                results = list(chain.from_iterable(imap_bounded(upload_batch, batcher.batches(orders),
+                                                                upload_workers)))
+            else:
+                results = [j for batch in batcher.batches(orders) for j in upload_batch(batch)]
+        finally:
+            # No more routes get ready
+            ready_routes.put(None)
+        logging.info('{} orders batches uploaded: {} inserted, {} updated'.format(
+            len(results), sum(j['inserted'] for j in results), sum(j['updated'] for j in results)))
+
+    def fix_routes_stage():
+        # Every route is fixed as soon as its orders are uploaded
+        fix_uploaded_routes(get_fix_tasks_stage(), progress, ready_routes, fix_workers, journal, fixed_routes)
+
+    def upload_orders_and_fix_routes_async():
+        import asyncio
+        from ya_courier_helpers import async_engine
+        asyncio.run(async_engine.upload_orders_and_fix_routes(
+            orders, progress, get_fix_tasks_stage(), batcher, journal, fixed_routes,
+            concurrency=concurrency or async_engine.CONCURRENCY,
+            compress=get_client().compress
+        ))
+
+    scheduler = StageScheduler()
+    scheduler.add('depot', upload_depots_stage)
+    scheduler.add('couriers', upload_couriers_stage)
+    # Listing pages shift while orders are uploaded, so the orders are listed first
+    scheduler.add('orders_list', list_orders_stage)
+    scheduler.add('routes', upload_routes_stage, deps=('depot', 'couriers') + (('orders_list',) if delta else ()))
+    if engine == ENGINE_ASYNC:
+        # Times its orders and fix parts as 'orders' and 'fix' stages of its own
+        scheduler.add('orders_and_fix', upload_orders_and_fix_routes_async, deps=('routes', 'orders_list'))
+    else:
+        scheduler.add('orders', upload_orders_stage, deps=('routes', 'orders_list'))
+        scheduler.add('fix', fix_routes_stage, deps=('routes', 'orders_list'))
+    try:
+        scheduler.run()
+    finally:
+        if build_pool:
+            build_pool.shutdown()
+        # Routes fixed before a failure are recorded too
+        if fixed_routes:
+            fixed_routes.save()
 
-    logging.info('Uploading data for date: {}'.format(s['options']['date']))
+    logging.info('DATA UPLOADED SUCCESSFULLY')
 
-    upload_depot(r['depot'], depot_address)
-    upload_couriers([v for v in r['vehicles'] if v['id'] in [r['vehicle_id'] for r in s['routes']]])
-    upload_routes(s, r['depot'])
-    for chunk in chunks(r['locations'], 500):
-        upload_orders(chunk, s, orders_dict, phone)
-    fix_orders(s)
 
-    logging.info('DATA UPLOADED SUCCESSFULLY')
+def get_task_logs(task_ids, stream=False, cache=None, offline=False):
+    """
+    Gets MVRP request and response logs of all tasks in parallel. Returns a list of (request, response).
+    """
+    jobs = [(get_log, task_id) for task_id in task_ids for get_log in (get_mvrp_request, get_mvrp_solution)]
+    with Pool(len(jobs)) as p:
+        logs = p.starmap(lambda get_log, task_id: get_log(task_id, stream=stream, cache=cache, offline=offline), jobs)
+    return list(zip(logs[::2], logs[1::2]))
+
+
+def iter_tasks(logs):
+    """
+    Yields (solver_request, solver_solution, depot_address) of (request, response) logs taking them out of the list,
+    so that every log is freed once upload_tasks has converted it.
+    """
+    logs.reverse()
+    while logs:
+        req, resp = logs.pop()
+        yield req, resp['result'], req['depot'].get('ref', 'Склад')
 
 
 def parse_args():
     parser = argparse.ArgumentParser(usage=usage())
 
-    parser.add_argument('--task-id', required=True, help='Your MVRP task ID to upload to Ya.Courier')
+    parser.add_argument('--task-id', required=True, nargs='+',
+                        help='Your MVRP task ID to upload to Ya.Courier. Several tasks solved for the same date are '
+                             'uploaded together')
     parser.add_argument('--date', type=valid_date, help='Upload data to this date')
     parser.add_argument('--clear', action='store_true', help='Clear ALL data for this date')
-
-    return parser.parse_args()
+    parser.add_argument('--delta', action='store_true',
+                        help='Upload only orders which differ from the ones already uploaded for the date and fix only '
+                             'routes whose orders or their sequence changed')
+    parser.add_argument('--resume', action='store_true',
+                        help='Skip stages finished by the previous failed upload of this task and date')
+    parser.add_argument('--journal-dir', default=JOURNAL_DIR,
+                        help='Directory to keep upload journals and routes fixed for --delta in, the routes are '
+                             'kept for a week (default: $YA_COURIER_JOURNAL_DIR or {})'.format(DEFAULT_JOURNAL_DIR))
+    parser.add_argument('--stream-logs', action='store_true',
+                        help='Parse MVRP logs while downloading and keep only the fields used for uploading')
+    parser.add_argument('--cache-dir', default=MVRP_LOG_CACHE_DIR,
+                        help='Directory to cache MVRP logs in (default: $YA_COURIER_MVRP_LOG_CACHE_DIR)')
+    parser.add_argument('--cache-size-mb', type=positive_int, default=MVRP_LOG_CACHE_SIZE_MB,
+                        help='MVRP log cache size limit, least recently used logs are removed over it')
+    parser.add_argument('--offline', action='store_true', help='Upload from cached MVRP logs only')
+    parser.add_argument('--gzip', action='store_true', help='Gzip request bodies')
+    parser.add_argument('--engine', choices=(ENGINE_THREADS, ENGINE_ASYNC), default=ENGINE_THREADS,
+                        help='Run orders upload, route fixing and clearing on a thread pool or on asyncio')
+    parser.add_argument('--concurrency', type=positive_int,
+                        help='Maximum number of requests in flight with --engine async (default: 1000)')
+    parser.add_argument('--clear-workers', type=positive_int, default=CLEAR_WORKERS,
+                        help='Number of parallel deletions made by --clear')
+    parser.add_argument('--upload-workers', type=positive_int, default=1,
+                        help='Number of orders batches uploaded in parallel')
+    parser.add_argument('--batch-size', type=positive_int,
+                        help='Maximum number of orders uploaded in one request (default: batches are sized by '
+                             'their bytes and upload time)')
+    parser.add_argument('--build-workers', type=positive_int, default=1,
+                        help='Number of processes building and serializing orders, for very large tasks, '
+                             'they are only started on Linux')
+    parser.add_argument('--fix-workers', type=positive_int, default=1,
+                        help='Number of routes whose orders are fixed in parallel')
+    parser.add_argument('--metrics-out',
+                        help='Write per-endpoint request and stage timing metrics to this file: Prometheus text '
+                             'format for .prom and .txt files, JSON otherwise')
+
+    args = parser.parse_args()
+    args.task_id = list(dict.fromkeys(args.task_id))
+    if args.offline and not args.cache_dir:
+        parser.error('--offline requires --cache-dir')
+    return args
 
 
 def usage():
@@ -289,40 +683,57 @@ def usage():
 
 def main():
     args = parse_args()
+    get_client().compress = args.gzip
 
+    try:
+        run(args)
+    finally:
+        if args.metrics_out:
+            METRICS.write(args.metrics_out)
+
+
+def run(args):
     if args.clear:
-        delete_routes_and_orders(args.date)
+        with METRICS.stage('clear'):
+            if args.engine == ENGINE_ASYNC:
+                import asyncio
+                from ya_courier_helpers import async_engine
+                asyncio.run(async_engine.delete_routes_and_orders(
+                    args.date, concurrency=args.concurrency or async_engine.CONCURRENCY
+                ))
+            else:
+                delete_routes_and_orders(args.date, args.clear_workers)
+        # Routes fixed before are deleted with the date
+        FixedRoutes.remove(FixedRoutes.get_path(args.journal_dir, get_company_id(), args.date))
     else:
-        req = get_mvrp_request(args.task_id)
-        resp = get_mvrp_solution(args.task_id)
-
-        for loc in req['locations']:
-            if not loc.get('ref'):
-                loc['ref'] = str(loc['id'])
-
-        for route in resp['result']['routes']:
-            for node in route['route']:
-                if not node['node']['value'].get('ref'):
-                    node['node']['value']['ref'] = str(node['node']['value']['id'])
-
-        assert len({loc['ref'] for loc in req['locations']}) == \
-            len({loc['ref'][:MAX_REF_LEN] for loc in req['locations']}), \
-            "Location ref length should be shorter than 80 characters"
-
-        for loc in req['locations']:
-            loc['ref'] = loc['ref'][:MAX_REF_LEN]
-
-        for route in resp['result']['routes']:
-            for node in route['route']:
-                node['node']['value']['ref'] = node['node']['value']['ref'][:MAX_REF_LEN]
-
-        upload_data(
-            req,
-            resp['result'],
-            defaultdict(dict),
-            req['depot'].get('ref', 'Склад'),
-            date=args.date
-        )
+        cache = MvrpLogCache(args.cache_dir, args.cache_size_mb * 1024 * 1024) if args.cache_dir else None
+        with METRICS.stage('mvrp_logs'):
+            logs = get_task_logs(args.task_id, stream=args.stream_logs, cache=cache, offline=args.offline)
+
+        date = args.date or logs[0][1]['result']['options']['date']
+        journal = UploadJournal(UploadJournal.get_path(args.journal_dir, args.task_id, date), resume=args.resume)
+        fixed_routes_path = FixedRoutes.get_path(args.journal_dir, get_company_id(), date)
+        FixedRoutes.remove_old(args.journal_dir, datetime.now(), keep=fixed_routes_path)
+        try:
+            upload_tasks(
+                iter_tasks(logs),
+                defaultdict(dict),
+                date=args.date,
+                upload_workers=args.upload_workers,
+                fix_workers=args.fix_workers,
+                delta=args.delta,
+                journal=journal,
+                engine=args.engine,
+                concurrency=args.concurrency,
+                batch_size=args.batch_size,
+                build_workers=args.build_workers,
+                fixed_routes=FixedRoutes(fixed_routes_path)
+            )
+        except BaseException:
+            journal.close()
+            logging.error('Upload failed, run again with --resume to continue from {}'.format(journal.path))
+            raise
+        journal.close(remove=True)
 
 
 if __name__ == '__main__':
@@ -1,10 +1,16 @@
 import argparse
 import sys
+from functools import partial
+from itertools import chain
 
-from ya_courier_helpers.util import orders_batch_upload
+from ya_courier_helpers.batcher import AdaptiveBatcher
+from ya_courier_helpers.client import ApiClient, is_batch_too_large
+from ya_courier_helpers.metrics import METRICS
+from ya_courier_helpers.util import orders_batch_upload, imap_bounded, positive_int
 
 DELIMITER = '\t'
 LINE_FORMAT = '<order_number>{}<service_duration_in_seconds>'.format(DELIMITER)
+WORKERS = 4
 
 
 def parse_args():
@@ -12,6 +18,15 @@ def parse_args():
 
     parser.add_argument('--company-id', required=True, type=int, help='Your company ID in Ya.Courier')
     parser.add_argument('--token', required=True, help='Your Oauth token in Ya.Courier')
+    parser.add_argument('--gzip', action='store_true', help='Gzip request bodies')
+    parser.add_argument('--batch-size', type=positive_int,
+                        help='Maximum number of orders uploaded in one request (default: batches are sized by '
+                             'their bytes and upload time)')
+    parser.add_argument('--workers', type=positive_int, default=WORKERS,
+                        help='Number of requests sent in parallel')
+    parser.add_argument('--metrics-out',
+                        help='Write per-endpoint request metrics to this file: Prometheus text format for .prom and '
+                             '.txt files, JSON otherwise')
 
     return parser.parse_args()
 
@@ -26,33 +41,52 @@ def usage():
 
 
 def get_request_data(stream):
-    number_duration_pairs = [line.split(DELIMITER) for line in stream]
-    request_data = []
-
-    for i, pair in enumerate(number_duration_pairs):
+    for i, line in enumerate(stream):
+        pair = line.rstrip('\r\n').split(DELIMITER)
         if len(pair) == 2:
-            request_data.append({'number': pair[0], 'service_duration_s': pair[1]})
+            yield {'number': pair[0], 'service_duration_s': pair[1]}
         else:
             print('Line {} has incorrect format and is skipped. Format: {}'.format(i, LINE_FORMAT))
 
-    return request_data
 
+def upload_batch(client, batch):
+    response = orders_batch_upload(client, batch)
+    if response.status_code == 200:
+        return len(batch), response.json()['updated'], None
+    return len(batch), 0, response.text
 
-def main():
-    args = parse_args()
-    request_data = get_request_data(sys.stdin)
 
-    if request_data:
-        response = orders_batch_upload(args.company_id, args.token, request_data)
+def upload_batches(client, batcher, batch):
+    return batcher.send(partial(upload_batch, client), batch, is_batch_too_large)
+
 
-        if response.status_code == 200:
-            print('Data uploaded successfully:\n\tOrders updated: {updated}'.format(**response.json()))
+def main():
+    args = parse_args()
+    client = ApiClient(args.company_id, args.token, verify=False, compress=args.gzip, pool_size=args.workers)
+    batcher = AdaptiveBatcher(max_items=args.batch_size, codec=client.codec)
+    batches = batcher.batches(get_request_data(sys.stdin))
+
+    batch_count = 0
+    failed_count = 0
+    total_updated = 0
+    for i, (size, updated, error) in enumerate(chain.from_iterable(
+            imap_bounded(partial(upload_batches, client, batcher), batches, args.workers))):
+        batch_count += 1
+        if error is None:
+            total_updated += updated
+            print('Batch {} uploaded successfully:\n\tOrders updated: {}'.format(i, updated))
         else:
-            print('Nothing was changed. Error uploading data:')
-            response_text = response.text
-            print(response_text)
-            if 'psycopg2.IntegrityError' in response_text:
+            failed_count += size
+            print('Batch {} of {} orders was not changed. Error uploading data:'.format(i, size))
+            print(error)
+            if 'psycopg2.IntegrityError' in error:
                 print('Most probably some orders were not created in Ya.Courier')
+    if args.metrics_out:
+        METRICS.write(args.metrics_out)
+
+    if batch_count:
+        print('Total: {} batches sent:\n\tOrders updated: {}\n\tOrders failed: {}'.format(
+            batch_count, total_updated, failed_count))
     else:
         print('Empty input data. No data was uploaded.')
 
@@ -0,0 +1,144 @@
+import logging
+import multiprocessing
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from ya_courier_helpers.codec import DEFAULT_CODEC
+from ya_courier_helpers.solution_index import is_fake_ref
+from ya_courier_helpers.util import imap_bounded
+
+# Locations built by a worker process at a time
+SHARD_SIZE = 5000
+
+# (locations by id and index of every task, orders_dict, phone, codec) of the upload in a worker process
+_source = None
+
+
+class EncodedOrder(object):
+    """
+    Order serialized to JSON with its number and route number kept for the upload journal and RouteProgress.
+    """
+    __slots__ = ('number', 'route_number', 'body')
+
+    def __init__(self, number, route_number, body):
+        self.number = number
+        self.route_number = route_number
+        self.body = body
+
+
+def encoded_size(order):
+    # A comma separates orders in the list
+    return len(order.body) + 1
+
+
+def encode_orders(orders):
+    """
+    Returns JSON list of EncodedOrder orders.
+    """
+    return b'[' + b','.join(order.body for order in orders) + b']'
+
+
+def is_uploadable(l, index):
+    return l.id in index.nodes and not is_fake_ref(l.ref)
+
+
+def build_order(l, index, orders_dict, phone):
+    node = index.nodes[l.id]
+    # get: orders_dict may be a defaultdict, which would keep an empty dict for every order
+    extra = orders_dict.get(l.ref, {})
+    return {
+        'number': l.ref,
+        'lat': l.lat,
+        'lon': l.lon,
+        'address': l.description,
+        'phone': extra.get('customer_phone', phone),
+        'service_duration_s': 0 if node.multi_order else l.service_duration_s + l.shared_service_duration_s,
+        'status': 'confirmed',
+        'customer_name': l.title,
+        'weight': extra.get('weight_kg', 0),
+        'time_interval': l.time_window,
+        'route_number': node.route.number
+    }
+
+
+def build_orders(locations, index, orders_dict, phone):
+    """
+    Yields orders of Location records, so that only the orders being uploaded are kept.
+    """
+    for l in locations:
+        if is_uploadable(l, index):
+            yield build_order(l, index, orders_dict, phone)
+        elif l.id in index.dropped_refs:
+            logging.error('Order {} is dropped. Skipping it.'.format(index.dropped_refs[l.id]))
+        else:
+            logging.error('Order {} was skipped.'.format(l.ref))
+
+
+def init_worker(task_locations, orders_dict, phone, codec):
+    """
+    Runs in a worker process once it is forked: keeps the upload source for build_shard, with locations
+    of every task by their ids.
+    """
+    global _source
+    _source = ([({l.id: l for l in locations}, index) for locations, index in task_locations], orders_dict, phone,
+               codec)
+
+
+def build_shard(shard):
+    """
+    Runs in a worker process: returns (numbers, route numbers, serialized orders) of (task number, location ids).
+    Lists of strings are pickled several times faster than EncodedOrder records.
+    """
+    tasks, orders_dict, phone, codec = _source
+    task, ids = shard
+    locations, index = tasks[task]
+    numbers, route_numbers, bodies = [], [], []
+    for order in build_orders([locations[id] for id in ids], index, orders_dict, phone):
+        numbers.append(order['number'])
+        route_numbers.append(order['route_number'])
+        bodies.append(codec.dumps(order))
+    return numbers, route_numbers, bodies
+
+
+def start_build_pool(task_locations, orders_dict, phone, codec=DEFAULT_CODEC, workers=1):
+    """
+    Returns a pool of `workers` processes building and serializing orders of (locations, index) task_locations
+    for iter_encoded_orders, None if they are built in this process.
+    Workers are forked with the task records, which cost more to pickle than to build the orders of, so the pool
+    is started before the upload starts any threads. Locations may be left out of task_locations later.
+    Forking is only safe on Linux, elsewhere orders are built in this process.
+    """
+    if workers <= 1:
+        return None
+    if not sys.platform.startswith('linux') or threading.active_count() > 1:
+        logging.warning('Worker processes can not be forked here, orders are built in this process')
+        return None
+    executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork'), initializer=init_worker,
+                                   initargs=(task_locations, orders_dict, phone, codec))
+    # All workers are forked on the first submit
+    executor.submit(int).result()
+    return executor
+
+
+def iter_shards(task_locations):
+    for task, (locations, _) in enumerate(task_locations):
+        for start in range(0, len(locations), SHARD_SIZE):
+            yield task, [l.id for l in locations[start:start + SHARD_SIZE]]
+
+
+def iter_encoded_orders(task_locations, orders_dict, phone, codec=DEFAULT_CODEC, workers=1, executor=None):
+    """
+    Yields EncodedOrder of the locations of (locations, index) task_locations in their order.
+    With executor started by start_build_pool orders are built by its `workers` processes, which get ids
+    of SHARD_SIZE locations at a time. Only shards being built or waiting to be taken are kept.
+    """
+    if executor is None:
+        for locations, index in task_locations:
+            for order in build_orders(locations, index, orders_dict, phone):
+                yield EncodedOrder(order['number'], order['route_number'], codec.dumps(order))
+        return
+
+    for numbers, route_numbers, bodies in imap_bounded(build_shard, iter_shards(task_locations), workers, executor):
+        for order in zip(numbers, route_numbers, bodies):
+            yield EncodedOrder(*order)
@@ -0,0 +1,278 @@
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+# 500 is not retried: Ya.Courier answers it to some requests which are not going to succeed,
+# e.g. clearing fixed orders of a route without them
+RETRIABLE_STATUS_CODES = (429, 502, 503, 504)
+THROTTLING_STATUS_CODES = (429, 503)
+
+MAX_ATTEMPTS = 5
+BACKOFF_BASE_S = 0.5
+BACKOFF_MAX_S = 30
+RETRY_BUDGET_RATIO = 0.2
+RETRY_BUDGET_MAX = 50
+BREAKER_FAILURES = 20
+BREAKER_OPEN_S = 5
+BREAKER_MAX_OPEN_S = 300
+LIMIT_DECREASE_RATIO = 0.75
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+def parse_retry_after(value):
+    """
+    Returns seconds to wait from Retry-After header value given either in seconds or as HTTP date,
+    None if the value is missing or invalid.
+    """
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return int(value)
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return max(0.0, (date - datetime.now(timezone.utc)).total_seconds())
+
+
+class RetryBudget(object):
+    """
+    Retries allowed to all workers together: every request adds `ratio` of a retry up to `max_tokens`,
+    every retry takes one. Retries stay a fraction of the traffic when all requests start failing.
+    """
+
+    def __init__(self, ratio=RETRY_BUDGET_RATIO, max_tokens=RETRY_BUDGET_MAX):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self.lock = threading.Lock()
+
+    def deposit(self):
+        with self.lock:
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self):
+        with self.lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class CircuitBreaker(object):
+    """
+    Opens after `failures` failed requests in a row of all workers. While it is open no requests are sent.
+    After open_s one request probes the server: success closes the circuit, failure opens it again
+    for twice as long. CircuitOpenError is raised once it has been open for max_open_s.
+    """
+
+    def __init__(self, failures=BREAKER_FAILURES, open_s=BREAKER_OPEN_S, max_open_s=BREAKER_MAX_OPEN_S):
+        self.failures = failures
+        self.open_s = open_s
+        self.max_open_s = max_open_s
+        self.lock = threading.Lock()
+        self.failed = 0
+        self.opened_at = None
+        self.open_until = None
+        self.open_period = open_s
+        self.probing = False
+
+    def wait_time(self):
+        """
+        Returns seconds to wait before sending a request, 0 if it can be sent now.
+        """
+        with self.lock:
+            if self.opened_at is None:
+                return 0
+            now = time.monotonic()
+            if now - self.opened_at > self.max_open_s:
+                raise CircuitOpenError('Server is failing for {:.0f} s'.format(now - self.opened_at))
+            if now < self.open_until:
+                return self.open_until - now
+            if not self.probing:
+                self.probing = True
+                return 0
+            return min(1, self.open_period)
+
+    def on_success(self):
+        with self.lock:
+            if self.opened_at is not None:
+                logging.warning('Circuit closed, server is back')
+            self.failed = 0
+            self.opened_at = None
+            self.open_period = self.open_s
+            self.probing = False
+
+    def on_failure(self):
+        with self.lock:
+            self.failed += 1
+            now = time.monotonic()
+            if self.probing:
+                self.probing = False
+                self.open_period = min(self.open_period * 2, self.max_open_s)
+                self.open_until = now + self.open_period
+            elif self.opened_at is None and self.failed >= self.failures:
+                self.opened_at = now
+                self.open_until = now + self.open_period
+                logging.warning('Circuit opened after {} failed requests, pausing for {} s'.format(
+                    self.failed, self.open_period))
+
+
+class AdaptiveLimit(object):
+    """
+    Number of requests allowed in flight, from 1 to max_limit. It is multiplied by LIMIT_DECREASE_RATIO
+    when the server throttles and grows by one after `limit` successful requests sent while the limit was
+    reached. Requests sent before the last decrease are ignored: they were sent under the previous limit
+    and are throttled together.
+    """
+
+    def __init__(self, max_limit):
+        self.max_limit = max_limit
+        self.limit = max_limit
+        self.successes = 0
+        self.decreased_at = 0
+        self.lock = threading.Lock()
+
+    def set_max_limit(self, max_limit):
+        with self.lock:
+            self.max_limit = max_limit
+            self.limit = max_limit
+
+    def on_success(self, sent_at, in_flight):
+        with self.lock:
+            # Workers waiting for retries do not show whether the server would take more requests
+            if self.limit >= self.max_limit or sent_at < self.decreased_at or in_flight < self.limit:
+                return
+            self.successes += 1
+            if self.successes >= self.limit:
+                self.limit += 1
+                self.successes = 0
+
+    def on_throttle(self, sent_at):
+        with self.lock:
+            if sent_at < self.decreased_at or self.limit == 1:
+                return
+            self.limit = max(1, int(self.limit * LIMIT_DECREASE_RATIO))
+            self.successes = 0
+            self.decreased_at = time.monotonic()
+            logging.warning('Server throttles requests, lowering concurrency to {}'.format(self.limit))
+
+
+class RetryPolicy(object):
+    """
+    Retries of all workers of a client: jittered exponential backoff honoring Retry-After,
+    shared retry budget, circuit breaker and adaptive number of requests in flight.
+    """
+
+    def __init__(self, max_in_flight, max_attempts=MAX_ATTEMPTS, backoff_base_s=BACKOFF_BASE_S,
+                 backoff_max_s=BACKOFF_MAX_S):
+        self.max_attempts = max_attempts
+        self.backoff_base_s = backoff_base_s
+        self.backoff_max_s = backoff_max_s
+        self.budget = RetryBudget()
+        self.breaker = CircuitBreaker()
+        self.limit = AdaptiveLimit(max_in_flight)
+
+        self.in_flight = 0
+        self.in_flight_changed = threading.Condition()
+
+    def backoff(self, attempt, retry_after=None):
+        """
+        Returns seconds to wait before the next attempt after `attempt` failed ones.
+        Retry-After is honored up to backoff_max_s.
+        """
+        delay = random.uniform(0, min(self.backoff_max_s, self.backoff_base_s * 2 ** (attempt - 1)))
+        if retry_after is not None:
+            # Spread retries of the requests throttled together
+            delay = min(retry_after, self.backoff_max_s) + random.uniform(0, self.backoff_base_s)
+        return delay
+
+    def can_retry(self, attempt, retry_after=None):
+        # The server tells when to retry throttled requests, they are limited by the adaptive limit instead
+        return attempt < self.max_attempts and (retry_after is not None or self.budget.withdraw())
+
+    def on_success(self, sent_at):
+        self.budget.deposit()
+        self.breaker.on_success()
+        self.limit.on_success(sent_at, self.in_flight)
+
+    def on_failure(self, status, sent_at):
+        self.budget.deposit()
+        self.breaker.on_failure()
+        if status in THROTTLING_STATUS_CODES:
+            self.limit.on_throttle(sent_at)
+
+    def acquire(self):
+        """
+        Waits for the circuit to close and for a free slot under the adaptive limit. Returns the time
+        the request is sent at.
+        """
+        while True:
+            wait = self.breaker.wait_time()
+            if not wait:
+                break
+            time.sleep(wait)
+        with self.in_flight_changed:
+            while self.in_flight >= self.limit.limit:
+                self.in_flight_changed.wait()
+            self.in_flight += 1
+        return time.monotonic()
+
+    def release(self):
+        with self.in_flight_changed:
+            self.in_flight -= 1
+            self.in_flight_changed.notify_all()
+
+    def on_error(self, e, classify, attempt, sent_at):
+        """
+        Records a failed attempt sent at sent_at. Returns seconds to wait before the next attempt and its number,
+        None if e should be raised. classify(e) returns (retriable, status, retry_after) for the exception.
+        """
+        retriable, status, retry_after = classify(e)
+        if not retriable:
+            # The server is alive and answered
+            self.on_success(sent_at)
+            return None
+        self.on_failure(status, sent_at)
+        if not self.can_retry(attempt, retry_after):
+            return None
+        delay = self.backoff(attempt, retry_after)
+        logging.warning('Attempt {} failed: {}. Retrying in {:.1f} s'.format(
+            attempt, str(e) or type(e).__name__, delay))
+        # Requests throttled under a limit which has since been lowered are not counted: the limit is lowered
+        # a bounded number of times and a request would otherwise fail before the limit settles
+        if status in THROTTLING_STATUS_CODES and sent_at < self.limit.decreased_at:
+            return delay, attempt
+        return delay, attempt + 1
+
+    def call(self, func, classify, on_retry=None):
+        """
+        Calls func() sending one request until it succeeds or fails with an error which should not be retried.
+        """
+        attempt = 1
+        while True:
+            sent_at = self.acquire()
+            try:
+                result = func()
+            except Exception as e:
+                retry = self.on_error(e, classify, attempt, sent_at)
+                if retry is None:
+                    raise
+            else:
+                self.on_success(sent_at)
+                return result
+            finally:
+                self.release()
+
+            delay, attempt = retry
+            time.sleep(delay)
+            if on_retry:
+                on_retry()
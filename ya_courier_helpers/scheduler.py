@@ -0,0 +1,53 @@
+import threading
+from collections import OrderedDict
+
+from ya_courier_helpers.metrics import METRICS
+
+
+class StageScheduler(object):
+    """
+    Runs stages of a DAG: every stage starts on a thread of its own once the stages it depends on
+    are finished, so independent stages run concurrently. Time of every stage is recorded in METRICS.
+    After a stage fails no more stages are started, run() raises its error once the running ones finish.
+    """
+
+    def __init__(self):
+        self.stages = OrderedDict()
+
+    def add(self, name, func, deps=()):
+        for dep in deps:
+            if dep not in self.stages:
+                raise ValueError('Stage {} depends on unknown stage {}'.format(name, dep))
+        self.stages[name] = (func, tuple(deps))
+
+    def run(self):
+        finished = set()
+        started = set()
+        errors = []
+        changed = threading.Condition()
+
+        def run_stage(name, func):
+            try:
+                with METRICS.stage(name):
+                    func()
+            except Exception as e:
+                with changed:
+                    errors.append(e)
+            finally:
+                with changed:
+                    finished.add(name)
+                    changed.notify()
+
+        with changed:
+            while True:
+                if not errors:
+                    for name, (func, deps) in self.stages.items():
+                        if name not in started and finished.issuperset(deps):
+                            started.add(name)
+                            threading.Thread(target=run_stage, args=(name, func), daemon=True).start()
+                if len(finished) == len(started):
+                    break
+                changed.wait()
+
+        if errors:
+            raise errors[0]
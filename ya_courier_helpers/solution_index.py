@@ -0,0 +1,48 @@
+from ya_courier_helpers.model import Route, RouteNode, Vehicle
+
+FAKE_REF_PREFIXES = ('respawn_', 'FAKE')
+
+
+def is_fake_ref(ref):
+    return ref.startswith(FAKE_REF_PREFIXES)
+
+
+def make_route_number(vehicle_ref, shift_id, date):
+    return '{}-{}-{}'.format(vehicle_ref, shift_id, date)
+
+
+class SolutionIndex(object):
+    """
+    Lookups over MVRP solution built in one pass over its routes. Only Route and RouteNode records are kept,
+    the solution itself can be freed.
+    Build it after the solution date is final: route numbers include the date.
+    """
+
+    def __init__(self, solution):
+        self.date = solution['options']['date']
+        self.vehicles = {v['id']: Vehicle.from_dict(v) for v in solution['vehicles']}
+        self.dropped_refs = {l['id']: l['ref'] for l in solution['dropped_locations']}
+
+        self.routes = []
+        # RouteNode of every location in routes by location id
+        self.nodes = {}
+
+        for route in solution['routes']:
+            r = Route(make_route_number(self.vehicles[route['vehicle_id']].number, route['shift']['id'], self.date),
+                      route['vehicle_id'], route['shift']['id'])
+            for loc in route['route']:
+                if loc['node']['type'] == 'location':
+                    value = loc['node']['value']
+                    self.nodes[value['id']] = RouteNode(r, loc['multi_order'])
+                    if not is_fake_ref(value['ref']):
+                        r.orders.append(value['ref'])
+            self.routes.append(r)
+
+        self.route_vehicle_ids = {route.vehicle_id for route in self.routes}
+
+    @property
+    def route_numbers(self):
+        return [route.number for route in self.routes]
+
+    def courier_number(self, vehicle_id):
+        return self.vehicles[vehicle_id].number
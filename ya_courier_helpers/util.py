@@ -1,18 +1,40 @@
 import argparse
-import contextlib
 import json
 import logging
-import warnings
-from functools import partialmethod
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-import requests
-from retrying import retry
+from functools import lru_cache
 
-from ya_courier_helpers.config import ORDERS_BATCH_API_URL, ORDERS_LIST_API_URL, YA_COURIER_TOKEN, YA_COURIER_URL, \
-    MVRP_LOG_URL
+from ya_courier_helpers.batcher import REQUEST_ENTITY_TOO_LARGE
+from ya_courier_helpers.client import ApiClient, get_batch_classify
+from ya_courier_helpers.config import MVRP_LOG_URL, get_company_id, get_token
+from ya_courier_helpers.mvrp_log import REQUEST_FIELDS, RESPONSE_FIELDS, load_pruned
 
 
-SESSION = requests.Session()
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+TIME_CACHE_SIZE = 65536
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Returns ApiClient used by the request helpers below. It is created on first use
+    from YA_COURIER_COMPANY_ID and YA_COURIER_TOKEN environment variables.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = ApiClient(get_company_id(), get_token())
+    return _client
+
+
+def set_pool_size(size):
+    get_client().set_pool_size(size)
 
 
 def date_parser(date_str):
@@ -22,60 +44,94 @@ def date_parser(date_str):
         raise argparse.ArgumentTypeError("Invalid date ({0}). Please, use format YYYY-MM-DD.".format(date_str))
 
 
-@contextlib.contextmanager
-def no_ssl_verification():
-    old_request = requests.Session.request
-    requests.Session.request = partialmethod(old_request, verify=False)
-    warnings.filterwarnings('ignore', 'Unverified HTTPS request')
-    yield
-    warnings.resetwarnings()
-    requests.Session.request = old_request
+def orders_batch_upload(client, data):
+    """
+    Uploads orders and returns the response as is. HTTPError is raised if the batch is too large
+    to be sent at once, so that AdaptiveBatcher.send splits it.
+    """
+    r = client.send_with_retries('post', client.url('orders-batch'), data, classify=get_batch_classify(data))
+    if r.status_code == REQUEST_ENTITY_TOO_LARGE:
+        r.raise_for_status()
+    return r
+
+
+def orders_list_by_date(client, date, page=None):
+    url = 'orders?date={}'.format(date)
+    if page is not None:
+        url += '&page={}'.format(page)
+    return client.send_with_retries('get', client.url(url))
 
 
-def get_auth_header(token):
-    return {
-        'Authorization': 'Auth {}'.format(token),
-        'Content-Type': 'application/json'
-    }
+def iter_orders_by_date(client, date):
+    def fetch_page(page):
+        r = orders_list_by_date(client, date, page)
+        r.raise_for_status()
+        return client.codec.loads(r.content)
 
+    return iter_pages(fetch_page)
 
-def orders_batch_upload(company_id, token, data):
-    with no_ssl_verification():
-        return requests.post(url=ORDERS_BATCH_API_URL.format(company_id),
-                             data=json.dumps(data),
-                             headers=get_auth_header(token))
 
+def iter_pages(fetch_page):
+    """
+    Yields items of a paginated listing. fetch_page(page) returns items of the page (starting from 1),
+    an empty list after the last one. The next page is fetched in background while the current one is consumed.
+    """
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        page = 1
+        future = executor.submit(fetch_page, page)
+        first_item = None
+        while True:
+            items = future.result()
+            if not items:
+                return
+            if page > 1 and items[0] == first_item:
+                logging.warning('Page {} repeats the previous one, the listing is not paginated'.format(page))
+                return
+            first_item = items[0]
+            page += 1
+            future = executor.submit(fetch_page, page)
+            for item in items:
+                yield item
+
+
+@lru_cache(maxsize=TIME_CACHE_SIZE)
+def parse_time_sec(str_time):
+    """
+    Parses time in "15", "15:40", "15:40:01" formats with optional days offset: "1.08:00".
+    Returns number of seconds.
+    """
+    days, sep, hms = str_time.partition('.')
+    if not sep:
+        days, hms = '0', str_time
+
+    parts = hms.split(':')
+    if len(parts) > 3 or not days.isdigit() or not all(p.isdigit() for p in parts):
+        raise ValueError('Invalid time: {}'.format(str_time))
+    parts = [int(p) for p in parts] + [0] * (3 - len(parts))
+    hours, minutes, seconds = parts
+    if hours > 23 or minutes > 59 or seconds > 59:
+        raise ValueError('Invalid time: {}'.format(str_time))
 
-def orders_list_by_date(company_id, token, date):
-    with no_ssl_verification():
-        return requests.get(url=ORDERS_LIST_API_URL.format(company_id, date),
-                            headers=get_auth_header(token))
+    return int(days) * 86400 + hours * 3600 + minutes * 60 + seconds
 
 
 def parse_time(str_time):
     """
-    Parses time in "15", "15:40", "15:40:01" formats.
+    Parses time in formats supported by parse_time_sec.
     Returns timedelta object
     """
-    sep_count = str_time.count(':')
-    if sep_count == 2:
-        t = datetime.strptime(str_time, '%H:%M:%S')
-    elif sep_count == 1:
-        t = datetime.strptime(str_time, '%H:%M')
-    else:
-        t = datetime.strptime(str_time, '%H')
-    return timedelta(hours=t.hour, minutes=t.minute, seconds=t.second)
+    return timedelta(seconds=parse_time_sec(str_time))
 
 
+@lru_cache(maxsize=TIME_CACHE_SIZE)
 def parse_interval_sec(time_interval):
     """
     Parses time interval string separated by minus: "15:00 - 15:30".
-    Time format can be any supported by parse_time.
-    Returns (timedelta1, timedelta2) tuple.
+    Time format can be any supported by parse_time_sec.
+    Returns (seconds1, seconds2) tuple.
     """
     t = time_interval.split('-')
-    t = [v.strip() for v in t]
-    return parse_time(t[0]).seconds, parse_time(t[1]).seconds
+    return parse_time_sec(t[0].strip()), parse_time_sec(t[1].strip())
 
 
 def chunks(l, n):
@@ -83,6 +139,27 @@ def chunks(l, n):
         yield l[i:i + n]
 
 
+def imap_bounded(func, iterable, workers, executor=None):
+    """
+    Maps func over iterable in a thread pool and yields results in order.
+    Unlike Pool.imap it takes items from iterable only when there is room for them,
+    so at most 2 * workers items are held at once. func is submitted to executor if it is given,
+    e.g. a process pool of `workers` processes.
+    """
+    if executor is None:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            yield from imap_bounded(func, iterable, workers, executor)
+        return
+
+    futures = deque()
+    for item in iterable:
+        if len(futures) >= 2 * workers:
+            yield futures.popleft().result()
+        futures.append(executor.submit(func, item))
+    while futures:
+        yield futures.popleft().result()
+
+
 def get_duplicates(l):
     seen = {}
     dupes = []
@@ -98,41 +175,83 @@ def get_duplicates(l):
     return dupes
 
 
-def get_mvrp_solution(solution_id):
-    return request(MVRP_LOG_URL.format('response', solution_id), 'get')
+def get_mvrp_solution(solution_id, stream=False, cache=None, offline=False):
+    return get_mvrp_log('response', solution_id, RESPONSE_FIELDS, stream, cache, offline)
 
 
-def get_mvrp_request(solution_id):
-    return request(MVRP_LOG_URL.format('request', solution_id), 'get')
+def get_mvrp_request(solution_id, stream=False, cache=None, offline=False):
+    return get_mvrp_log('request', solution_id, REQUEST_FIELDS, stream, cache, offline)
+
+
+def get_mvrp_log(kind, solution_id, fields, stream=False, cache=None, offline=False):
+    """
+    Gets MVRP request or response log. With a cache (see mvrp_log.MvrpLogCache) the log is downloaded
+    only if it is not cached yet, offline mode never downloads it.
+    """
+    url = MVRP_LOG_URL.format(kind, solution_id)
+
+    if cache is None:
+        if offline:
+            raise ValueError('Offline mode requires MVRP log cache')
+        if stream:
+            return stream_request(url, fields)
+        return request(url, 'get')
+
+    path = cache.get(kind, solution_id)
+    if path:
+        logging.info('Using cached MVRP {} log {}'.format(kind, path))
+    elif offline:
+        raise ValueError('MVRP {} log for task {} is not cached'.format(kind, solution_id))
+    else:
+        path = download_to_cache(url, cache, kind, solution_id)
+
+    with cache.open(path) as f:
+        if stream:
+            return load_pruned(f, fields)
+        return json.load(f)
 
 
-@retry(retry_on_exception=lambda x: isinstance(x, (requests.exceptions.Timeout,
-                                                   requests.exceptions.ConnectionError)),
-       wait_random_min=0,
-       wait_random_max=2000,
-       stop_max_attempt_number=3
-       )
 def request(url, method, data=None):
-    r = SESSION.request(
-        url=url,
-        method=method,
-        data=json.dumps(data) if data else None,
-        headers=get_auth_header(YA_COURIER_TOKEN)
-    )
-    if r.status_code >= 400:
-        logging.error(r.text)
-    r.raise_for_status()
-    return r.json()
+    return get_client().request(url, method, data)
+
+
+def stream_request(url, fields):
+    """
+    GETs a JSON document and parses it while it is being downloaded, keeping only `fields`.
+    See ya_courier_helpers.mvrp_log for the fields format.
+    """
+    def load():
+        with get_client().get_stream(url) as r:
+            r.raw.decode_content = True
+            return load_pruned(r.raw, fields)
+
+    return get_client().call(load, 'get', url)
+
+
+def download_to_cache(url, cache, kind, solution_id):
+    def download():
+        with get_client().get_stream(url) as r:
+            return cache.put(kind, solution_id, r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE))
+
+    return get_client().call(download, 'get', url)
 
 
 def get_ya_courier_url(url):
-    return '{}/{}'.format(YA_COURIER_URL, url)
+    return get_client().url(url)
 
 
 def post_request(url, data):
     return request(get_ya_courier_url(url), 'post', data)
 
 
+def post_batch_request(url, data, body=None):
+    """
+    POSTs a list of items, body is the list already serialized.
+    """
+    return get_client().request(get_ya_courier_url(url), 'post', data if body is None else body,
+                                classify=get_batch_classify(data))
+
+
 def get_request(url):
     return request(get_ya_courier_url(url), 'get')
 
@@ -152,3 +271,13 @@ def valid_date(s):
     except ValueError:
         msg = "Not a valid date: '{0}'.".format(s)
         raise argparse.ArgumentTypeError(msg)
+
+
+def positive_int(s):
+    try:
+        value = int(s)
+    except ValueError:
+        value = 0
+    if value < 1:
+        raise argparse.ArgumentTypeError("Not a positive integer: '{0}'.".format(s))
+    return value